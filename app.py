@@ -2,13 +2,34 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly. graph_objects as go
+import openpyxl
 import numpy as np
 import os
+import sys
+import csv
+import itertools
+import multiprocessing
+import threading
 import traceback
 import base64
+import codecs
+import contextlib
+import io
+import hashlib
+import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 # --- Page Config ---
 st.set_page_config(page_title="Audi DCC 效能看板", layout="wide", page_icon="🏎️")
 
@@ -42,108 +63,609 @@ PATH_M = os.path.join(DATA_DIR, "store_mapping.xlsx")
 
 LAST_UPDATE_FILE = os.path. join(DATA_DIR, "_last_upload_time.txt")
 
+# Processed snapshots (Parquet, keyed by input content hash)
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "_snapshots")
+SNAPSHOT_KEEP = 3
+# 处理逻辑变更时递增，使旧快照失效
+PIPELINE_VERSION = 6
+
+# 各考评周期的处理结果归档 (history/<上传时间>/*.parquet)，用于环比；
+# 与仓库中的 history/ 目录一一对应，随启动同步取回
+HISTORY_DIR = os.path.join(DATA_DIR, "history")
+HISTORY_FILES = ("advisors.parquet", "stores.parquet")
+
 # --- GitHub Integration ---
 GH_TOKEN = st.secrets.get("GH_TOKEN", "")
 GH_DATA_REPO = st.secrets. get("GH_DATA_REPO", "")
+# 可指向本地替身服务器做联调测试
+GH_API_URL = st.secrets.get("GH_API_URL", "https://api.github.com").rstrip("/")
+GH_TIMEOUT = (5, 60)  # (连接, 读取) 秒
+GH_MAX_WORKERS = 8
+# 为空时使用仓库默认分支
+GH_BRANCH = st.secrets.get("GH_BRANCH", "")
+# 流式 base64 编码的分块大小，须为 3 的倍数才能直接拼接
+GH_BLOB_CHUNK = 3 * 256 * 1024
+# 每个仓库文件的 ETag / sha 缓存，用于条件请求与免查询上传
+SYNC_STATE_FILE = os.path.join(DATA_DIR, "_sync_state.json")
+
+# (仓库内文件名, 本地路径)
+SYNC_FILES = [
+    ("funnel.xlsx", PATH_F),
+    ("dcc.xlsx", PATH_D),
+    ("ams.xlsx", PATH_A),
+    ("store_rank.xlsx", PATH_S_XLSX),
+    ("store_rank.csv", PATH_S_CSV),
+    ("store_mapping.xlsx", PATH_M),
+    ("_last_upload_time.txt", LAST_UPDATE_FILE),
+]
+# 报表的规范化副本（已定位表头、去重列名并统一类型），随原始报表一同同步
+INGEST_SUFFIX = ".parquet"
+# 表头定位/列名清洗/类型推断 (_parse_report) 变更时递增，只使副本失效；
+# 与 PIPELINE_VERSION 分开，下游处理逻辑变更不必重新解析原始报表
+INGEST_VERSION = 1
+SYNC_FILES += [(repo + INGEST_SUFFIX, local + INGEST_SUFFIX) for repo, local in SYNC_FILES if local != LAST_UPDATE_FILE]
+
+# xlsx 解析进程池：一次最多 5 个报表；单个文件超过 EXCEL_POOL_TIMEOUT 秒未返回则回退到本进程
+EXCEL_POOL_WORKERS = 5
+EXCEL_POOL_TIMEOUT = 180
 
 def get_github_headers():
     """返回 GitHub API 请求头"""
     return {
         "Authorization": f"token {GH_TOKEN}",
-        "Accept": "application/vnd.github. v3+json"
+        "Accept": "application/vnd.github.v3+json"
     }
 
-def upload_file_to_github(local_path:  str, repo_path: str) -> bool:
-    """上传文件到 GitHub 私有仓库"""
+@st.cache_resource
+def get_github_client():
+    """进程内共享的 GitHub 客户端：连接池会话 + 各文件的 ETag/sha 缓存"""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "PUT", "POST", "PATCH"]),
+    )
+    adapter = HTTPAdapter(pool_maxsize=GH_MAX_WORKERS, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(get_github_headers())
+
+    files = {}
+    try:
+        with open(SYNC_STATE_FILE, "r", encoding="utf-8") as f:
+            files = json.load(f)
+    except (OSError, ValueError):
+        pass
+    return {"session": session, "lock": threading.Lock(), "files": files}
+
+def _contents_url(repo_path: str) -> str:
+    return f"{GH_API_URL}/repos/{GH_DATA_REPO}/contents/{repo_path}"
+
+def _write_atomic(local_path: str, content):
+    """先写临时文件再替换，读取方不会看到写了一半的文件
+
+    content 为 bytes 或按块产出 bytes 的迭代器（流式下载）。
+    """
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    tmp_path = f"{local_path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            if isinstance(content, bytes):
+                f.write(content)
+            else:
+                for chunk in content:
+                    f.write(chunk)
+        os.replace(tmp_path, local_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _sync_entry(client, repo_path: str) -> dict:
+    with client["lock"]:
+        return dict(client["files"].get(repo_path, {}))
+
+def _set_sync_entry(client, repo_path: str, **fields):
+    """更新某文件的 ETag/sha 并落盘"""
+    with client["lock"]:
+        client["files"].setdefault(repo_path, {}).update(fields)
+        try:
+            _write_atomic(SYNC_STATE_FILE, json.dumps(client["files"]).encode("utf-8"))
+        except OSError:
+            pass
+
+def _fetch_remote_sha(client, repo_path: str):
+    """查询远端文件当前 sha，不存在返回 None"""
+    resp = client["session"].get(_contents_url(repo_path), timeout=GH_TIMEOUT)
+    if resp.status_code == 200:
+        return resp.json().get("sha")
+    return None
+
+def upload_file_to_github(local_path:  str, repo_path: str, client=None) -> bool:
+    """上传文件到 GitHub 私有仓库
+
+    优先使用缓存的 sha，省去一次查询；sha 过期或并发提交冲突 (409/422)
+    时重新查询 sha 并退避重试。
+    """
     if not GH_TOKEN or not GH_DATA_REPO: 
         return False
+    client = client or get_github_client()
     
     try: 
         with open(local_path, "rb") as f:
             content = base64.b64encode(f.read()).decode("utf-8")
         
-        api_url = f"https://api.github.com/repos/{GH_DATA_REPO}/contents/{repo_path}"
-        headers = get_github_headers()
+        api_url = _contents_url(repo_path)
+        entry = _sync_entry(client, repo_path)
+        sha = entry["sha"] if "sha" in entry else _fetch_remote_sha(client, repo_path)
         
-        # 检查文件是否已存在（获取 sha）
-        resp = requests.get(api_url, headers=headers)
-        sha = None
-        if resp.status_code == 200:
-            sha = resp.json().get("sha")
-        
-        # 上传/更新文件
-        data = {
-            "message": f"Update {repo_path} - {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-            "content": content,
-        }
-        if sha:
-            data["sha"] = sha
-        
-        resp = requests.put(api_url, headers=headers, json=data)
-        return resp.status_code in [200, 201]
+        for attempt in range(3):
+            data = {
+                "message": f"Update {repo_path} - {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+                "content": content,
+            }
+            if sha:
+                data["sha"] = sha
+            
+            resp = client["session"].put(api_url, json=data, timeout=GH_TIMEOUT)
+            if resp.status_code in [200, 201]:
+                # 远端内容已变，旧 ETag 作废
+                _set_sync_entry(client, repo_path, sha=resp.json()["content"]["sha"], etag=None)
+                return True
+            if resp.status_code not in [409, 422]:
+                return False
+            time.sleep(0.5 * (2 ** attempt))
+            sha = _fetch_remote_sha(client, repo_path)
+        return False
     
-    except Exception as e:
-        st.error(f"GitHub 上传失败:  {e}")
+    except Exception:
         return False
 
-def download_file_from_github(repo_path: str, local_path: str) -> bool:
-    """从 GitHub 私有仓库下载文件"""
+def _git_url(path: str) -> str:
+    return f"{GH_API_URL}/repos/{GH_DATA_REPO}/git/{path}"
+
+def _github_branch(client) -> str:
+    """目标分支：secrets 中的 GH_BRANCH，未配置时取仓库默认分支（只查询一次）"""
+    with client["lock"]:
+        if client.get("branch"):
+            return client["branch"]
+    branch = GH_BRANCH
+    if not branch:
+        resp = client["session"].get(f"{GH_API_URL}/repos/{GH_DATA_REPO}", timeout=GH_TIMEOUT)
+        resp.raise_for_status()
+        branch = resp.json()["default_branch"]
+    with client["lock"]:
+        client["branch"] = branch
+    return branch
+
+class _Base64JsonBody:
+    """把本地文件流式编码成 {"encoding": "base64", "content": "..."} 请求体
+
+    长度预先算出，requests 按 Content-Length 边读边发，不会把整份编码结果
+    放进内存；支持 seek(0)，连接层重试时可以重放。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._prefix = b'{"encoding": "base64", "content": "'
+        self._suffix = b'"}'
+        size = os.path.getsize(path)
+        self._len = len(self._prefix) + 4 * ((size + 2) // 3) + len(self._suffix)
+        self._file = None
+        self.seek(0)
+
+    def __len__(self):
+        return self._len
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=0):
+        if pos != 0 or whence != 0:
+            raise OSError("only rewinding to the start is supported")
+        self.close()
+        self._file = open(self.path, "rb")
+        self._buf, self._off, self._pos, self._done = self._prefix, 0, 0, False
+        return 0
+
+    def _refill(self):
+        chunk = self._file.read(GH_BLOB_CHUNK)
+        if chunk:
+            self._buf = base64.b64encode(chunk)
+        else:
+            self._buf, self._done = self._suffix, True
+        self._off = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._len
+        parts, got = [], 0
+        while got < size:
+            if self._off >= len(self._buf):
+                if self._done:
+                    break
+                self._refill()
+                continue
+            part = self._buf[self._off:self._off + size - got]
+            self._off += len(part)
+            got += len(part)
+            parts.append(part)
+        self._pos += got
+        return b"".join(parts)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def _create_blob(client, local_path: str) -> str:
+    """流式上传一个文件为 blob，返回其 sha"""
+    body = _Base64JsonBody(local_path)
+    try:
+        resp = client["session"].post(
+            _git_url("blobs"), data=body,
+            headers={"Content-Type": "application/json"}, timeout=GH_TIMEOUT,
+        )
+    finally:
+        body.close()
+    resp.raise_for_status()
+    return resp.json()["sha"]
+
+def _download_blob(client, sha: str, local_path: str):
+    """按 blob 原始字节流式下载，用于超过 Contents API 内联上限的大文件"""
+    resp = client["session"].get(
+        _git_url(f"blobs/{sha}"), headers={"Accept": "application/vnd.github.raw"},
+        timeout=GH_TIMEOUT, stream=True,
+    )
+    with resp:
+        resp.raise_for_status()
+        _write_atomic(local_path, resp.iter_content(chunk_size=1024 * 1024))
+
+def publish_files_to_github(files, deletes=(), client=None) -> bool:
+    """把一批文件 [(本地路径, 仓库文件名)] 合成一次提交推送到 GitHub
+
+    各文件先并发流式上传为 blob，再基于分支 head 建一棵 tree、一个 commit，
+    最后移动分支指针；deletes 中仍存在于仓库的文件在同一提交里删除。
+    分支被抢先更新 (422) 时基于新 head 重做，blob 无需重传。
+    仓库还没有任何提交时退回逐个文件的 Contents API。
+    """
     if not GH_TOKEN or not GH_DATA_REPO:
         return False
+    if not files and not deletes:
+        return True
+    client = client or get_github_client()
+    session = client["session"]
+
+    try:
+        branch = _github_branch(client)
+        resp = session.get(_git_url(f"ref/heads/{branch}"), timeout=GH_TIMEOUT)
+        if resp.status_code in [404, 409]:
+            # 空仓库：Git Data API 不可用，由 Contents API 创建首个提交
+            return all(upload_file_to_github(p, r, client=client) for p, r in files)
+        resp.raise_for_status()
+
+        with ThreadPoolExecutor(max_workers=min(GH_MAX_WORKERS, max(1, len(files)))) as pool:
+            blob_shas = list(pool.map(lambda job: _create_blob(client, job[0]), files))
+
+        for attempt in range(3):
+            if attempt:
+                time.sleep(0.5 * (2 ** attempt))
+                resp = session.get(_git_url(f"ref/heads/{branch}"), timeout=GH_TIMEOUT)
+                resp.raise_for_status()
+            head = resp.json()["object"]["sha"]
+            resp = session.get(_git_url(f"commits/{head}"), timeout=GH_TIMEOUT)
+            resp.raise_for_status()
+            base_tree = resp.json()["tree"]["sha"]
+
+            tree = [
+                {"path": repo_path, "mode": "100644", "type": "blob", "sha": sha}
+                for (_, repo_path), sha in zip(files, blob_shas)
+            ]
+            if deletes:
+                resp = session.get(_git_url(f"trees/{base_tree}"), timeout=GH_TIMEOUT)
+                resp.raise_for_status()
+                existing = {item["path"] for item in resp.json()["tree"]}
+                tree += [
+                    {"path": repo_path, "mode": "100644", "type": "blob", "sha": None}
+                    for repo_path in deletes if repo_path in existing
+                ]
+
+            resp = session.post(_git_url("trees"), json={"base_tree": base_tree, "tree": tree}, timeout=GH_TIMEOUT)
+            resp.raise_for_status()
+            resp = session.post(_git_url("commits"), timeout=GH_TIMEOUT, json={
+                "message": f"Update {len(files)} file(s) - {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+                "tree": resp.json()["sha"],
+                "parents": [head],
+            })
+            resp.raise_for_status()
+            resp = session.patch(_git_url(f"refs/heads/{branch}"), json={"sha": resp.json()["sha"]}, timeout=GH_TIMEOUT)
+            if resp.status_code == 200:
+                for (_, repo_path), sha in zip(files, blob_shas):
+                    _set_sync_entry(client, repo_path, sha=sha, etag=None)
+                for repo_path in deletes:
+                    _set_sync_entry(client, repo_path, sha=None, etag=None)
+                return True
+            if resp.status_code != 422:
+                return False
+        return False
+
+    except Exception:
+        return False
+
+def download_file_from_github(repo_path: str, local_path: str, client=None) -> str:
+    """从 GitHub 私有仓库下载文件（带 ETag 条件请求）
+
+    Contents API 不内联超过 1MB 的文件内容，此时改走 blob 原始字节流式下载。
+
+    返回 "updated" / "unchanged"（304，本地已是最新）/ "missing" / "failed"
+    """
+    if not GH_TOKEN or not GH_DATA_REPO:
+        return "failed"
+    client = client or get_github_client()
     
     try:
-        api_url = f"https://api.github.com/repos/{GH_DATA_REPO}/contents/{repo_path}"
-        headers = get_github_headers()
+        headers = {}
+        etag = _sync_entry(client, repo_path).get("etag")
+        if etag and os.path.exists(local_path):
+            headers["If-None-Match"] = etag
         
-        resp = requests.get(api_url, headers=headers)
-        if resp.status_code == 200:
-            content = base64.b64decode(resp.json()["content"])
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            with open(local_path, "wb") as f:
-                f.write(content)
-            return True
-        return False
+        resp = client["session"].get(_contents_url(repo_path), headers=headers, timeout=GH_TIMEOUT)
+        if resp.status_code == 304:
+            return "unchanged"
+        if resp.status_code == 404:
+            return "missing"
+        if resp.status_code != 200:
+            return "failed"
+        
+        payload = resp.json()
+        if payload.get("encoding") == "base64" and payload.get("content"):
+            _write_atomic(local_path, base64.b64decode(payload["content"]))
+        else:
+            _download_blob(client, payload["sha"], local_path)
+        _set_sync_entry(client, repo_path, sha=payload.get("sha"), etag=resp.headers.get("ETag"))
+        return "updated"
     
     except Exception: 
-        return False
-
-def sync_from_github():
-    """启动时从 GitHub 同步所有数据文件"""
+        return "failed"
+
+def _remote_history_files(client) -> dict:
+    """仓库 history/ 下的周期归档 {仓库路径: blob sha}，一次递归 tree 查询"""
+    session = client["session"]
+    resp = session.get(_git_url(f"ref/heads/{_github_branch(client)}"), timeout=GH_TIMEOUT)
+    if resp.status_code in [404, 409]:
+        return {}
+    resp.raise_for_status()
+    resp = session.get(_git_url(f"commits/{resp.json()['object']['sha']}"), timeout=GH_TIMEOUT)
+    resp.raise_for_status()
+    resp = session.get(_git_url(f"trees/{resp.json()['tree']['sha']}"), params={"recursive": "1"}, timeout=GH_TIMEOUT)
+    resp.raise_for_status()
+
+    files = {}
+    for item in resp.json()["tree"]:
+        parts = item["path"].split("/")
+        if (item.get("type") == "blob" and len(parts) == 3 and parts[0] == "history"
+                and parts[1] not in ("", ".", "..") and parts[2] in HISTORY_FILES):
+            files[item["path"]] = item["sha"]
+    return files
+
+def sync_from_github(force: bool = False, client=None, queue=None) -> dict:
+    """并发从 GitHub 同步数据文件
+
+    默认只下载本地缺失的文件；force=True 时对已有文件发条件请求，
+    远端未变化 (304) 的直接跳过。周期归档 (history/) 按仓库 tree 中的
+    blob sha 比对，只下载本地缺失或已变化的。返回 {仓库文件名: 状态}。
+    在后台线程中调用时需显式传入 client / queue。
+    """
     if not GH_TOKEN or not GH_DATA_REPO: 
-        return
+        return {}
     
-    files_to_sync = [
-        ("funnel.xlsx", PATH_F),
-        ("dcc. xlsx", PATH_D),
-        ("ams.xlsx", PATH_A),
-        ("store_rank. xlsx", PATH_S_XLSX),
-        ("store_rank.csv", PATH_S_CSV),
-        ("store_mapping. xlsx", PATH_M),
-        ("_last_upload_time.txt", LAST_UPDATE_FILE),
-    ]
+    client = client or get_github_client()
+    pending = pending_upload_paths(queue)
+    jobs = [(repo_name, local_path) for repo_name, local_path in SYNC_FILES
+            if local_path not in pending and (force or not os.path.exists(local_path))]
+    try:
+        history = _remote_history_files(client)
+    except Exception:
+        history = {}
+    for repo_name, sha in history.items():
+        local_path = os.path.join(DATA_DIR, *repo_name.split("/"))
+        if local_path in pending:
+            continue
+        if os.path.exists(local_path) and _sync_entry(client, repo_name).get("sha") == sha:
+            continue
+        jobs.append((repo_name, local_path))
+    if not jobs:
+        return {}
     
-    for repo_name, local_path in files_to_sync:
-        if not os.path.exists(local_path):
-            download_file_from_github(repo_name, local_path)
+    with ThreadPoolExecutor(max_workers=min(GH_MAX_WORKERS, len(jobs))) as pool:
+        statuses = list(pool.map(lambda job: download_file_from_github(*job, client=client), jobs))
+    return {repo_name: status for (repo_name, _), status in zip(jobs, statuses)}
+
+# --- Background Upload Queue ---
+# 待上传文件持久化在磁盘上，进程重启后继续上传
+UPLOAD_QUEUE_FILE = os.path.join(DATA_DIR, "_upload_queue.json")
+UPLOAD_RETRY_MAX_DELAY = 300  # 秒
+
+@st.cache_resource
+def get_upload_queue():
+    """进程内唯一的后台上传队列：{仓库文件名: 任务}，由守护线程逐批上传"""
+    pending = {}
+    try:
+        with open(UPLOAD_QUEUE_FILE, "r", encoding="utf-8") as f:
+            pending = json.load(f)
+    except (OSError, ValueError):
+        pass
+    queue = {
+        "lock": threading.Lock(),
+        "wake": threading.Event(),
+        "pending": pending,
+        "last_ok": None,
+    }
+    if GH_TOKEN and GH_DATA_REPO:
+        threading.Thread(
+            target=_upload_worker, args=(queue, get_github_client()),
+            name="github-upload", daemon=True,
+        ).start()
+    return queue
+
+def _save_upload_queue(queue):
+    """调用方需持有 queue["lock"]"""
+    try:
+        _write_atomic(UPLOAD_QUEUE_FILE, json.dumps(queue["pending"], ensure_ascii=False).encode("utf-8"))
+    except OSError:
+        pass
+
+def enqueue_upload(files, deletes=()):
+    """登记待上传文件 [(本地路径, 仓库文件名)] 并唤醒后台线程，立即返回
+
+    deletes 为需要从仓库删除的 [(本地路径, 仓库文件名)]。同一仓库文件重复
+    登记时合并为一个任务，上传时读取的是最新的本地文件。
+    """
+    queue = get_upload_queue()
+    with queue["lock"]:
+        for (local_path, repo_path), delete in itertools.chain(
+            zip(files, itertools.repeat(False)), zip(deletes, itertools.repeat(True))
+        ):
+            queue["pending"][repo_path] = {
+                "local": local_path,
+                "delete": delete,
+                "seq": time.time_ns(),
+                "attempts": 0,
+                "next_try": 0,
+                "error": None,
+            }
+        _save_upload_queue(queue)
+    queue["wake"].set()
+
+def _upload_worker(queue, client):
+    """后台线程：等待新任务或重试时间到，然后把所有到期任务合成一次提交"""
+    while True:
+        try:
+            with queue["lock"]:
+                waits = [job["next_try"] - time.time() for job in queue["pending"].values()]
+            if not waits or min(waits) > 0:
+                queue["wake"].wait(timeout=min(waits) if waits else None)
+                queue["wake"].clear()
+                continue
+
+            now = time.time()
+            with queue["lock"]:
+                due = [dict(job, repo=repo) for repo, job in queue["pending"].items() if job["next_try"] <= now]
+            # 本地已不存在的文件（如门店排名 xlsx/csv 互换）直接作废
+            uploads = [(job["local"], job["repo"]) for job in due
+                       if not job.get("delete") and os.path.exists(job["local"])]
+            deletes = [job["repo"] for job in due if job.get("delete")]
+            done = publish_files_to_github(uploads, deletes, client=client)
+            error = None if done else "GitHub 拒绝或超时"
+
+            with queue["lock"]:
+                for job in due:
+                    current = queue["pending"].get(job["repo"])
+                    if current is None or current["seq"] != job["seq"]:
+                        # 上传期间被重新登记，保留新任务
+                        continue
+                    if done:
+                        del queue["pending"][job["repo"]]
+                        queue["last_ok"] = time.time()
+                    else:
+                        current["attempts"] += 1
+                        current["next_try"] = time.time() + min(UPLOAD_RETRY_MAX_DELAY, 5 * 2 ** current["attempts"])
+                        current["error"] = error
+                _save_upload_queue(queue)
+        except Exception:
+            # 守护线程不能退出，出错后稍等再继续
+            time.sleep(5)
+
+def get_upload_status() -> dict:
+    """侧边栏展示用：待上传文件数、最大重试次数、最近错误与最近成功时间"""
+    queue = get_upload_queue()
+    with queue["lock"]:
+        jobs = list(queue["pending"].values())
+    errors = [job["error"] for job in jobs if job["error"]]
+    return {
+        "pending": len(jobs),
+        "attempts": max((job["attempts"] for job in jobs), default=0),
+        "error": errors[0] if errors else None,
+        "last_ok": queue["last_ok"],
+    }
 
-# 应用启动时自动同步数据
-sync_from_github()
+def pending_upload_paths(queue=None) -> set:
+    """尚未上传完成的本地路径；同步时跳过它们，避免旧的远端文件覆盖新数据"""
+    queue = queue or get_upload_queue()
+    with queue["lock"]:
+        return {job["local"] for job in queue["pending"].values()}
+
+
+# --- Startup Sync ---
+
+@st.cache_resource
+def get_startup_sync():
+    """每个进程只跑一次的启动同步：后台线程补齐缺失文件，页面先行渲染
+
+    已有的本地文件也按 ETag 发条件请求重新校验 (force=True)，
+    以便拿到其他副本上传的新版本；远端未变化时返回 304，不重新下载。
+    待上传的本地文件由 sync_from_github 跳过，不会被远端旧版本覆盖。
+    """
+    state = {"done": threading.Event(), "result": {}}
+    if not GH_TOKEN or not GH_DATA_REPO:
+        state["done"].set()
+        return state
+    
+    # 线程里没有 ScriptRunContext，缓存资源在这里取好再传进去
+    client, queue = get_github_client(), get_upload_queue()
+    
+    def run():
+        try:
+            state["result"] = sync_from_github(force=True, client=client, queue=queue)
+        finally:
+            state["done"].set()
+    
+    threading.Thread(target=run, name="github-startup-sync", daemon=True).start()
+    return state
+
+@st.fragment(run_every=2)
+def wait_for_startup_sync():
+    """启动同步完成后整页刷新，新到的文件经指纹变化进入 process_data"""
+    if startup_sync["done"].is_set():
+        st.rerun()
+    st.info("☁️ 正在从云端同步数据...")
+
+# 应用启动时在后台同步数据，不阻塞首屏
+startup_sync = get_startup_sync()
 
 
 # --- Helper Functions ---
 
-def save_uploaded_file(uploaded_file, save_path:  str) -> bool:
+def save_uploaded_file(uploaded_file, save_path:  str, is_rank_file: bool = False) -> bool:
+    """保存原始文件，并立即解析一次生成规范化副本（见 smart_read）"""
     try:
         with open(save_path, "wb") as f:
             f. write(uploaded_file.getbuffer())
-        return True
     except Exception as e:
         st. error(f"文件保存失败: {e}")
         return False
+    try:
+        smart_read(save_path, is_rank_file)
+    except Exception:
+        pass  # 副本只是加速，解析错误留到处理数据时再报告
+    return True
+
+
+def remove_report(local_path: str):
+    """删除本地报表及其规范化副本"""
+    for path in (local_path, ingest_path(local_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _with_ingest_copies(files):
+    """[(本地路径, 仓库路径)] 追加各自的规范化副本"""
+    return list(files) + [(ingest_path(p), r + INGEST_SUFFIX) for p, r in files]
 
 
 def upload_all_to_github():
-    """将所有数据文件上传到 GitHub"""
+    """将所有数据文件登记到后台上传队列，立即返回"""
     files_to_upload = [
         (PATH_F, "funnel.xlsx"),
         (PATH_D, "dcc.xlsx"),
@@ -151,26 +673,23 @@ def upload_all_to_github():
         (LAST_UPDATE_FILE, "_last_upload_time.txt"),
     ]
     
-    # 门店排名文件
+    # 门店排名文件：云端只保留本次的格式，否则其他副本会优先读到旧的 xlsx
+    stale = []
     if os.path.exists(PATH_S_XLSX):
         files_to_upload. append((PATH_S_XLSX, "store_rank.xlsx"))
+        stale.append((PATH_S_CSV, "store_rank.csv"))
     elif os.path.exists(PATH_S_CSV):
         files_to_upload. append((PATH_S_CSV, "store_rank.csv"))
+        stale.append((PATH_S_XLSX, "store_rank.xlsx"))
     
-    success = True
-    for local_path, repo_name in files_to_upload:
-        if os.path.exists(local_path):
-            if not upload_file_to_github(local_path, repo_name):
-                success = False
-    
-    return success
+    files_to_upload = _with_ingest_copies(files_to_upload)
+    enqueue_upload([(p, r) for p, r in files_to_upload if os.path.exists(p)], deletes=_with_ingest_copies(stale))
 
 
 def upload_mapping_to_github():
-    """将归属表上传到 GitHub"""
+    """将归属表登记到后台上传队列"""
     if os.path.exists(PATH_M):
-        return upload_file_to_github(PATH_M, "store_mapping.xlsx")
-    return False
+        enqueue_upload([(p, r) for p, r in _with_ingest_copies([(PATH_M, "store_mapping.xlsx")]) if os.path.exists(p)])
 
 
 def get_store_rank_path():
@@ -226,61 +745,323 @@ def dedupe_columns(columns):
     return out
 
 
-def smart_read(file_path:  str, is_rank_file: bool = False):
-    """鲁棒读取（xlsx/csv/误后缀 xlsx）+ 自动找表头 + 列名去重"""
+HEADER_KEYWORDS = ["门店", "顾问", "管家", "排名", "代理商", "序号", "线索", "质检", "添加微信", "区域经理", "省份", "城市"]
+
+
+def _header_cell(v) -> str:
+    """表头单元格转字符串，与 pandas 读取后 astype(str) 的结果保持一致"""
+    if v is None or (isinstance(v, float) and np.isnan(v)) or v == "":
+        return "nan"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _find_header_row(rows, search_rows: int) -> int:
+    """在前 search_rows 行中找到第一个包含关键字的行作为表头"""
+    for i, row in enumerate(rows[:search_rows]):
+        row_values = ",".join(_header_cell(v) for v in row)
+        if any(k in row_values for k in HEADER_KEYWORDS):
+            return i
+    return 0
+
+
+def _open_source(source):
+    """路径则以二进制打开；已打开的文件对象（如上传的文件）回到开头后原样使用、不关闭"""
+    if isinstance(source, str):
+        return open(source, "rb")
+    source.seek(0)
+    return contextlib.nullcontext(source)
+
+
+def _peek_excel_rows(source, nrows: int):
+    """只读模式流式读取首个工作表的前 nrows 行；source 为路径或二进制文件对象"""
+    # 传文件对象，避免 openpyxl 按后缀拒绝误命名为 .csv 的 xlsx
+    with _open_source(source) as f:
+        wb = openpyxl.load_workbook(f, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            return [list(r) for r in ws.iter_rows(max_row=nrows, values_only=True)]
+        finally:
+            wb.close()
+
+
+def _peek_csv_rows(source, encoding: str, nrows: int):
+    """只解码 CSV 的前 nrows 行（空行也计入，与 skiprows 的行号一致）"""
+    with _open_source(source) as f:
+        text = io.TextIOWrapper(f, encoding=encoding, newline="")
+        try:
+            return list(itertools.islice(csv.reader(text), nrows))
+        finally:
+            text.detach()
+
+
+CSV_ENCODINGS = ["utf-8-sig", "gb18030", "utf-16"]
+
+
+def sniff_encoding(source, sample_size: int = 64 * 1024) -> str:
+    """只读一次 BOM + 字节样本来判断 CSV 编码"""
+    with _open_source(source) as f:
+        sample = f.read(sample_size)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if sample.count(b"\x00") > len(sample) // 4:
+        # 无 BOM 的 UTF-16：ASCII 字符的另一半字节为 0
+        return "utf-16-le" if sample[1::2].count(b"\x00") >= sample[::2].count(b"\x00") else "utf-16-be"
+    try:
+        # 样本可能截断在多字节字符中间，未读完时不做 final 校验
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < sample_size)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        # GBK 系统导出；gb18030 是 gbk 的超集
+        return "gb18030"
+
+
+def _read_csv_body(file_path: str, encoding: str, skiprows: int) -> pd.DataFrame:
+    """C 引擎读取正文，只有真正的解析错误才退回 python 引擎"""
+    kwargs = dict(header=None, skiprows=skiprows, encoding=encoding, on_bad_lines="skip")
+    try:
+        return pd.read_csv(file_path, **kwargs)
+    except pd.errors.ParserError:
+        return pd.read_csv(file_path, engine="python", **kwargs)
+
+
+def _clean_header(names):
+    """表头单元格文本 → 去空白、换行并去重后的列名"""
+    return dedupe_columns(
+        pd.Index(names)
+        .str.strip()
+        .str.replace("\n", "", regex=False)
+        .str.replace("\r", "", regex=False)
+    )
+
+
+def _apply_header(df: pd.DataFrame, header) -> pd.DataFrame:
+    """把探测到的表头行套到正文上，并清洗、去重列名"""
+    names = [_header_cell(v) for v in header]
+    if df.shape[1] > len(names):
+        names += ["nan"] * (df.shape[1] - len(names))
+    elif df.shape[1] < len(names):
+        df = df.reindex(columns=range(len(names)))
+
+    df. columns = _clean_header(names)
+
+    df = df.loc[: , df.columns.notna()]
+    df = df. loc[: , df.columns != "nan"]
+
+    return df
+
+
+def _read_excel_body(file_path: str, skiprows: int, excel_pool=None) -> pd.DataFrame:
+    """读取 xlsx 正文；给定进程池 (get_excel_pool) 时在子进程中解析
+
+    子进程超时、崩溃或其他池错误时回退到本进程读取；超时或崩溃的进程池
+    会被丢弃，下次读取时重建。
+    """
+    if excel_pool is not None:
+        pool = _excel_pool_executor(excel_pool)
+        try:
+            return pool.submit(pd.read_excel, file_path, header=None, skiprows=skiprows).result(timeout=EXCEL_POOL_TIMEOUT)
+        except (FutureTimeoutError, BrokenProcessPool):
+            _discard_excel_pool(excel_pool, pool)
+        except Exception:
+            pass
+    return pd.read_excel(file_path, header=None, skiprows=skiprows)
+
+
+def smart_read(file_path:  str, is_rank_file: bool = False, excel_pool=None, digest=None):
+    """鲁棒读取（xlsx/csv/误后缀 xlsx）+ 自动找表头 + 列名去重
+
+    优先读取与原文件内容一致的规范化副本；否则解析原文件并写出副本，
+    此后每次缓存失效或其他副本只需读取 Parquet。
+    digest 为原文件的内容哈希 (file_fingerprint)；在后台线程中调用时
+    由调用方预先取好传入，缺省时在这里取（同一文件版本只计算一次）。
+    """
     if not file_path or not os.path. exists(file_path):
         return None
 
-    df = None
+    if digest is None:
+        digest = file_fingerprint(file_path)[2]
+    source_key = f"v{INGEST_VERSION}:{digest}"
+    df = load_ingest_copy(file_path, source_key)
+    if df is None:
+        df = _parse_report(file_path, is_rank_file, excel_pool)
+        if df is not None:
+            save_ingest_copy(file_path, source_key, df)
+    return df
+
+
+def _parse_report(file_path: str, is_rank_file: bool, excel_pool=None):
+    """解析原始报表：先流式预读前几行定位表头，再按 header 行号一次性读取正文，
+    避免整表以 object 字符串载入后再切片复制。"""
+    search_rows = 20 if is_rank_file else 15
+    rows = None
+    body = None
 
     try:
         with open(file_path, "rb") as f:
             sig = f.read(4)
         if sig == b"PK\x03\x04" or sig. startswith(b"PK"):
-            df = pd.read_excel(file_path, header=None)
+            rows = _peek_excel_rows(file_path, search_rows)
+            header_row = _find_header_row(rows, search_rows)
+            body = _read_excel_body(file_path, header_row + 1, excel_pool)
     except Exception: 
-        pass
+        rows = None
 
-    if df is None: 
-        encodings = ["utf-8-sig", "gb18030", "utf-16", "gbk"]
+    if rows is None: 
+        # 先嗅探编码；样本之后才出现解码错误时再依次尝试其余编码
+        sniffed = sniff_encoding(file_path)
+        encodings = [sniffed] + [e for e in CSV_ENCODINGS if e != sniffed]
         for enc in encodings: 
             try:
-                df = pd.read_csv(file_path, header=None, encoding=enc, engine="python", on_bad_lines="skip")
+                rows = _peek_csv_rows(file_path, enc, search_rows)
+                header_row = _find_header_row(rows, search_rows)
+                body = _read_csv_body(file_path, enc, header_row + 1)
+                break
+            except pd.errors.EmptyDataError:
+                body = pd.DataFrame()
                 break
-            except (UnicodeDecodeError, pd.errors.ParserError):
+            except (UnicodeError, pd.errors.ParserError):
+                rows = None
                 continue
             except Exception:
+                rows = None
                 continue
 
-    if df is None or df.empty:
+    if not rows or not any(_header_cell(v) != "nan" for row in rows for v in row):
         return None
 
-    keywords = ["门店", "顾问", "管家", "排名", "代理商", "序号", "线索", "质检", "添加微信", "区域经理", "省份", "城市"]
-    header_row = 0
+    return _apply_header(body, rows[header_row])
 
+
+def read_header(source, is_rank_file: bool = False):
+    """只读取表头区域，返回 smart_read 将得到的列名；无法识别表头时返回 None
+
+    source 为路径或二进制文件对象（如尚未保存的上传文件），不读取正文。
+    """
     search_rows = 20 if is_rank_file else 15
-    for i in range(min(search_rows, len(df))):
-        row_values = df.iloc[i]. astype(str).str.cat(sep=",")
-        if any(k in row_values for k in keywords):
-            header_row = i
-            break
+    with _open_source(source) as f:
+        sig = f.read(4)
 
-    df. columns = df.iloc[header_row]
-    df = df[header_row + 1:].reset_index(drop=True)
+    rows = None
+    if sig.startswith(b"PK"):
+        try:
+            rows = _peek_excel_rows(source, search_rows)
+        except Exception:
+            rows = None
+    if rows is None:
+        sniffed = sniff_encoding(source)
+        for enc in [sniffed] + [e for e in CSV_ENCODINGS if e != sniffed]:
+            try:
+                rows = _peek_csv_rows(source, enc, search_rows)
+                break
+            except (UnicodeError, csv.Error):
+                rows = None
 
-    df. columns = (
-        df.columns.astype(str)
-        .str.strip()
-        .str.replace("\n", "", regex=False)
-        .str.replace("\r", "", regex=False)
-    )
+    if not rows or not any(_header_cell(v) != "nan" for row in rows for v in row):
+        return None
+    names = _clean_header([_header_cell(v) for v in rows[_find_header_row(rows, search_rows)]])
+    return [c for c in names if c != "nan"]
 
-    df. columns = dedupe_columns(df.columns)
 
-    df = df.loc[: , df.columns.notna()]
-    df = df. loc[: , df.columns != "nan"]
+def ingest_path(file_path: str) -> str:
+    return file_path + INGEST_SUFFIX
 
-    return df
+
+def load_ingest_copy(file_path: str, source_key: str):
+    """读取规范化副本；不存在、已损坏或与原文件内容不符时返回 None"""
+    path = ingest_path(file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception:
+        return None
+    return df if df.attrs.get("source") == source_key else None
+
+
+def save_ingest_copy(file_path: str, source_key: str, df: pd.DataFrame):
+    """原子写入规范化副本，原文件的内容指纹记在 Parquet 元数据中"""
+    tmp = f"{ingest_path(file_path)}.{threading.get_ident()}.tmp"
+    try:
+        out = _parquet_ready(df)
+        out.attrs = {"source": source_key}
+        out.to_parquet(tmp, index=False)
+        os.replace(tmp, ingest_path(file_path))
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _is_zip_file(file_path: str) -> bool:
+    try:
+        with open(file_path, "rb") as f:
+            return f.read(2) == b"PK"
+    except OSError:
+        return False
+
+
+@st.cache_resource
+def get_excel_pool():
+    """xlsx 解析用的进程池，每个进程共享一个，首次使用时创建
+
+    用 fork 而不是 spawn：spawn 会在子进程里重新导入 Streamlit 脚本。
+    子进程只执行 pd.read_excel，不依赖本模块的任何状态。
+    注意 Streamlit 服务本身是多线程的，Python 3.12+ 对多线程进程 fork 会发出
+    DeprecationWarning：子进程可能继承被其他线程持有的锁而卡死，
+    因此 _read_excel_body 对每个任务设超时并回退到本进程读取。
+    """
+    return {"pool": None, "lock": threading.Lock()}
+
+
+def _excel_pool_supported(n_jobs: int) -> bool:
+    """单核、任务不足两个或不支持 fork 时不用进程池"""
+    cpus = os.cpu_count() or 1
+    return n_jobs >= 2 and cpus >= 2 and "fork" in multiprocessing.get_all_start_methods()
+
+
+def _excel_pool_executor(holder) -> ProcessPoolExecutor:
+    with holder["lock"]:
+        if holder["pool"] is None:
+            holder["pool"] = ProcessPoolExecutor(
+                max_workers=min(EXCEL_POOL_WORKERS, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("fork"),
+            )
+        return holder["pool"]
+
+
+def _discard_excel_pool(holder, pool: ProcessPoolExecutor):
+    """丢弃超时或崩溃的进程池，并结束卡住的子进程（否则退出时会等待它们）"""
+    with holder["lock"]:
+        if holder["pool"] is pool:
+            holder["pool"] = None
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def read_reports(specs, perf=None):
+    """并发读取多个报表，返回与 specs 顺序一致的 DataFrame 列表
+
+    specs 为 [(file_path, is_rank_file, digest), ...]，digest 为文件内容哈希
+    (file_fingerprint)，在这里预先取好，线程中不再访问 st.cache_data。
+    openpyxl 解析受 GIL 限制，xlsx 正文交给进程池；表头预读与 CSV 读取在线程中并发完成。
+    perf 为性能记录（见 new_perf_run），每个文件的读取单独计时。
+    """
+    if not specs:
+        return []
+    n_excel = sum(1 for p, _, _ in specs if p and _is_zip_file(p))
+    excel_pool = get_excel_pool() if _excel_pool_supported(n_excel) else None
+    with ThreadPoolExecutor(max_workers=len(specs)) as ex:
+        return list(ex.map(
+            lambda spec: perf_stage(
+                perf, f"读取 {os.path.basename(spec[0] or '')}", smart_read, spec[0], spec[1], excel_pool, spec[2],
+            ),
+            specs,
+        ))
 
 
 def clean_percent_col(df:  pd.DataFrame, col_name: str):
@@ -327,276 +1108,1199 @@ def _pick_any_col(df:  pd.DataFrame, any_keywords, exclude_keywords=None):
             return c
     return None
 
+# --- Snapshot Cache ---
+
+def file_digest(path: str) -> str:
+    """按内容计算文件哈希 (分块读取)"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_file_digest(path: str, size: int, mtime_ns: int) -> str:
+    """同一 (路径, 大小, 修改时间) 只计算一次内容哈希"""
+    return file_digest(path)
+
+
+def file_fingerprint(path: str):
+    """文件指纹: (大小, 修改时间, 内容哈希)；文件不存在时返回 None"""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, _cached_file_digest(path, stat.st_size, stat.st_mtime_ns)
+
+
+def get_dataset_fingerprint(paths) -> str:
+    """五个输入文件的联合指纹，只取决于文件内容，作为缓存与快照的键"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"v{PIPELINE_VERSION}".encode("utf-8"))
+    for p in paths:
+        h.update(b"|")
+        fp = file_fingerprint(p)
+        if fp is not None:
+            h.update(os.path.basename(p).encode("utf-8"))
+            h.update(fp[2].encode("utf-8"))
+    return h.hexdigest()
+
+
+def _parquet_ready(df: pd.DataFrame) -> pd.DataFrame:
+    """混合类型的 object 列转为字符串，保证可写入 Parquet"""
+    out = df.copy()
+    for c in out.columns:
+        if out[c].dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(out[c], skipna=True)
+        if kind not in ("string", "empty", "floating", "integer", "mixed-integer-float", "boolean"):
+            out[c] = out[c].where(out[c].isna(), out[c].astype(str))
+    return out
+
+
+def _snapshot_paths(digest: str):
+    return (
+        os.path.join(SNAPSHOT_DIR, f"{digest}_advisors.parquet"),
+        os.path.join(SNAPSHOT_DIR, f"{digest}_stores.parquet"),
+    )
+
+
+def load_snapshot(digest: str):
+    """读取已处理好的快照；不存在或损坏时返回 None"""
+    path_adv, path_sto = _snapshot_paths(digest)
+    if not (os.path.exists(path_adv) and os.path.exists(path_sto)):
+        return None
+    try:
+        return pd.read_parquet(path_adv), pd.read_parquet(path_sto)
+    except Exception:
+        return None
+
+
+def save_snapshot(digest: str, full_advisors: pd.DataFrame, full_stores: pd.DataFrame):
+    """原子写入快照，并只保留最近 SNAPSHOT_KEEP 份"""
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        for df, path in zip((full_advisors, full_stores), _snapshot_paths(digest)):
+            tmp = f"{path}.tmp"
+            _parquet_ready(df).to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+
+        digests = {}
+        for name in os.listdir(SNAPSHOT_DIR):
+            if name.endswith(".parquet"):
+                d = name.split("_", 1)[0]
+                mtime = os.path.getmtime(os.path.join(SNAPSHOT_DIR, name))
+                digests[d] = max(digests.get(d, 0), mtime)
+        stale = sorted(digests, key=digests.get, reverse=True)[SNAPSHOT_KEEP:]
+        for name in os.listdir(SNAPSHOT_DIR):
+            if name.split("_", 1)[0] in stale:
+                os.remove(os.path.join(SNAPSHOT_DIR, name))
+    except Exception:
+        pass
+
+# --- Dataset History ---
+
+def current_period_tag():
+    """本次考评周期的标签，取管理员上传时写入的时间，如 20240115-093000"""
+    try:
+        with open(LAST_UPDATE_FILE, "r", encoding="utf-8") as f:
+            return datetime.fromisoformat(f.read().strip()).strftime("%Y%m%d-%H%M%S")
+    except (OSError, ValueError):
+        return None
+
+
+def _history_paths(tag: str):
+    return tuple(os.path.join(HISTORY_DIR, tag, name) for name in HISTORY_FILES)
+
+
+def list_history() -> list:
+    """已归档的周期标签，按时间升序"""
+    try:
+        tags = os.listdir(HISTORY_DIR)
+    except OSError:
+        return []
+    return sorted(t for t in tags if all(os.path.exists(p) for p in _history_paths(t)))
+
+
+def previous_period_tag(tag):
+    """tag 之前最近的一个归档周期；没有时返回 None"""
+    if not tag:
+        return None
+    earlier = [t for t in list_history() if t < tag]
+    return earlier[-1] if earlier else None
+
+
+def save_history(tag: str, full_advisors: pd.DataFrame, full_stores: pd.DataFrame):
+    """归档本周期的处理结果；同一周期重新处理（如只更新归属表）时覆盖
+
+    本地磁盘在重启后不保留，归档同时登记到上传队列，重启后或其他副本
+    经启动同步取回；内容没有变化的文件不重复上传。
+    """
+    try:
+        os.makedirs(os.path.join(HISTORY_DIR, tag), exist_ok=True)
+        changed = []
+        for df, path, name in zip((full_advisors, full_stores), _history_paths(tag), HISTORY_FILES):
+            tmp = f"{path}.tmp"
+            _parquet_ready(df).to_parquet(tmp, index=False)
+            if os.path.exists(path) and file_digest(tmp) == file_digest(path):
+                os.remove(tmp)
+                continue
+            os.replace(tmp, path)
+            changed.append((path, f"history/{tag}/{name}"))
+        if changed and GH_TOKEN and GH_DATA_REPO:
+            enqueue_upload(changed)
+    except Exception:
+        pass
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_history_cube(tag: str):
+    """读取归档周期并汇总成 KPI 立方体，无需重新解析旧的 Excel"""
+    try:
+        path_adv, path_sto = _history_paths(tag)
+        return build_kpi_cube(pd.read_parquet(path_adv), pd.read_parquet(path_sto))
+    except Exception:
+        return None
+
+# --- Performance Log ---
+
+PERF_LOG_FILE = os.path.join(DATA_DIR, "_perf_log.json")
+PERF_LOG_KEEP = 20  # 保留最近的处理记录条数
+_perf_log_lock = threading.Lock()
+
+
+def _peak_rss_mb():
+    """进程峰值常驻内存 (MB)；不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _current_rss_mb():
+    """当前常驻内存 (MB)，读取 /proc/self/statm；非 Linux 返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _frame_stats(result):
+    """结果中 DataFrame 的总行数与内存占用 (MB)；结果为元组时逐个累加"""
+    frames = [f for f in (result if isinstance(result, tuple) else (result,)) if isinstance(f, pd.DataFrame)]
+    if not frames:
+        return None, None
+    mb = sum(int(f.memory_usage(index=True, deep=True).sum()) for f in frames) / 2**20
+    return sum(len(f) for f in frames), round(mb, 2)
+
+
+def new_perf_run() -> dict:
+    """一次数据处理的性能记录：各阶段依次追加到 stages"""
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "status": "running",
+        "seconds": None,
+        "peak_rss_mb": None,
+        "stages": [],
+        "cached": [],
+        "warnings": [],
+        "error": None,
+        "_start": time.perf_counter(),
+    }
+
+
+def perf_stage(run, name: str, func, *args):
+    """执行 func(*args)，把耗时、输出行数与内存记入 run；run 为 None 时直接执行
+
+    rss_delta_mb 为阶段前后常驻内存之差：峰值 (ru_maxrss) 是整个进程生命周期的
+    最高值，第一次高峰之后每个阶段都一样，无法指出是哪个阶段占用了内存。
+    可在多个线程中同时调用（list.append 是原子的），并发阶段的差值会互相包含。
+    """
+    if run is None:
+        return func(*args)
+    entry = {"stage": name, "seconds": None, "rows": None, "mb": None, "rss_delta_mb": None}
+    rss_before = _current_rss_mb()
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+        entry["rows"], entry["mb"] = _frame_stats(result)
+        return result
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        entry["seconds"] = round(time.perf_counter() - start, 4)
+        rss_after = _current_rss_mb()
+        if rss_before is not None and rss_after is not None:
+            entry["rss_delta_mb"] = round(rss_after - rss_before, 1)
+        run["stages"].append(entry)
+
+
+def finish_perf_run(run: dict, status: str):
+    """补全总耗时并写入 PERF_LOG_FILE（只保留最近 PERF_LOG_KEEP 条）"""
+    run["status"] = status
+    run["seconds"] = round(time.perf_counter() - run.pop("_start"), 4)
+    run["peak_rss_mb"] = _peak_rss_mb()
+    with _perf_log_lock:
+        log = (load_perf_log() + [run])[-PERF_LOG_KEEP:]
+        try:
+            _write_atomic(PERF_LOG_FILE, json.dumps(log, ensure_ascii=False, indent=1).encode("utf-8"))
+        except OSError:
+            pass
+
+
+def load_perf_log() -> list:
+    """按时间先后返回已记录的处理过程"""
+    try:
+        with open(PERF_LOG_FILE, "r", encoding="utf-8") as f:
+            log = json.load(f)
+        return log if isinstance(log, list) else []
+    except (OSError, ValueError):
+        return []
+
 # --- Data Processing ---
 
-@st.cache_data(ttl=300)
-def process_data(path_f, path_d, path_a, path_s, path_m):
+@st.cache_data(max_entries=4)
+def process_data(path_f, path_d, path_a, path_s, path_m, fingerprint, period=None):
+    """返回 (full_advisors, full_stores, kpi_cube)
+
+    fingerprint 由 get_dataset_fingerprint 计算；文件内容变化即自动失效。
+    period 为本次考评周期标签，新算出的结果会按它归档到 HISTORY_DIR。
+    各阶段的耗时与内存写入 PERF_LOG_FILE，在管理面板「性能诊断」中查看。
+    处理失败时抛出异常：st.cache_data 不缓存异常，下次运行会重新处理。
+    """
+    perf = new_perf_run()
+    status = "failed"
     try:
-        def remove_brackets(series):
-            if series is None:  return None
-            return series.astype(str).str.replace(r'[（\(].*? [）\)]', '', regex=True)
-
-        raw_f = smart_read(path_f)
-        raw_d = smart_read(path_d)
-        raw_a = smart_read(path_a)
-        raw_s = smart_read(path_s, is_rank_file=True)
-        raw_m = smart_read(path_m)
-
-        if raw_f is None or raw_d is None or raw_a is None or raw_s is None: 
-            return None, None
-
-        # ==========================================
-        # 0. 准备归属映射表 (Store Mapping)
-        # ==========================================
-        df_mapping = None
-        def strict_clean_str(series):
-            return series.astype(str).str.strip().str.replace(r'\s+', '', regex=True).str.lower().replace('nan', '')
-
-        if raw_m is not None:
-            raw_m = raw_m.rename(columns=lambda x: str(x).strip())
-            
-            col_mgr = _pick_any_col(raw_m, ["区域经理", "大区经理"])
-            col_prov = _pick_any_col(raw_m, ["省份", "省"])
-            col_city = _pick_any_col(raw_m, ["城市", "市"])
-            col_store = _pick_any_col(raw_m, ["门店名称", "代理商", "经销商"])
-
-            if col_mgr and col_store:
-                df_mapping = raw_m[[col_store]].copy()
-                df_mapping. rename(columns={col_store: "门店名称"}, inplace=True)
-                
-                df_mapping["区域经理"] = raw_m[col_mgr] if col_mgr else "未知"
-                df_mapping["省份"] = raw_m[col_prov] if col_prov else "未知"
-                df_mapping["城市"] = raw_m[col_city] if col_city else "未知"
-                
-                df_mapping["门店名称"] = remove_brackets(df_mapping["门店名称"])
-                df_mapping["Join_Key"] = strict_clean_str(df_mapping["门店名称"])
-                df_mapping = df_mapping.drop_duplicates(subset=["Join_Key"])
+        snapshot = perf_stage(perf, "读取快照", load_snapshot, fingerprint)
+        if snapshot is not None:
+            full_advisors, full_stores = snapshot
+        else:
+            full_advisors, full_stores = build_frames(path_f, path_d, path_a, path_s, path_m, perf)
+            perf_stage(perf, "保存快照", save_snapshot, fingerprint, full_advisors, full_stores)
+        if period and (snapshot is None or period not in list_history()):
+            perf_stage(perf, "归档历史", save_history, period, full_advisors, full_stores)
+        kpi_cube = perf_stage(perf, "KPI 汇总", build_kpi_cube, full_advisors, full_stores)
+        status = "ok"
+        return full_advisors, full_stores, kpi_cube
+    except Exception:
+        perf["error"] = traceback.format_exc()
+        raise
+    finally:
+        finish_perf_run(perf, status)
 
-        # ==========================================
-        # 1. 处理漏斗数据 (Funnel)
-        # ==========================================
-        store_col_f = _pick_col_exact(raw_f, "代理商") or _pick_any_col(raw_f, ["门店", "经销商"]) or raw_f. columns[0]
-        name_col_f = _pick_any_col(raw_f, ["管家", "顾问", "邀约"]) or raw_f.columns[1]
 
-        col_leads = "线上_有效线索数" if "线上_有效线索数" in raw_f.columns else ("线索量" if "线索量" in raw_f.columns else _pick_any_col(raw_f, ["有效线索", "线索数"]))
-        col_visits = "线上_到店数" if "线上_到店数" in raw_f. columns else ("到店量" if "到店量" in raw_f.columns else _pick_any_col(raw_f, ["到店数", "到店量"]))
-        col_excel_rate = _pick_any_col(raw_f, ["率"], exclude_keywords=["试驾", "成交"])
+AMS_CALC_COLS = ["conn_num", "conn_denom", "timely_num", "timely_denom",
+                 "call2_num", "call2_denom", "call3_num", "call3_denom"]
 
-        rename_dict_f = {store_col_f:  "门店名称", name_col_f:  "邀约专员/管家"}
-        if col_leads:  rename_dict_f[col_leads] = "线索量"
-        if col_visits: rename_dict_f[col_visits] = "到店量"
-        if col_excel_rate: rename_dict_f[col_excel_rate] = "Excel_Rate"
 
-        df_f = raw_f.rename(columns=rename_dict_f)
-        df_f. columns = dedupe_columns(df_f.columns)
+def map_unique(series: pd.Series, func, memo: dict | None = None) -> pd.Series:
+    """只对不重复的取值执行向量化的 func，再按编码映射回整列
 
-        if "门店名称" in df_f.columns:
-            df_f["门店名称"] = df_f["门店名称"].replace([r'^\s*$', 'nan', 'None'], np.nan, regex=True).ffill()
-            df_f["门店名称"] = remove_brackets(df_f["门店名称"])
+    门店/顾问名称的取值远少于行数；传入同一个 memo 可在多列之间
+    共享已经算出的结果。
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    # 转成 object 数组再逐个取值：逐元素迭代 Arrow 字符串数组要慢一个数量级
+    raw = pd.Series(uniques, dtype=object).astype(str).to_numpy(dtype=object)
+    memo = {} if memo is None else memo
+    todo = [v for v in dict.fromkeys(raw) if v not in memo]
+    if todo:
+        memo.update(zip(todo, func(pd.Series(todo, dtype=object)).to_numpy(dtype=object)))
+    return pd.Series(np.array([memo[v] for v in raw], dtype=object)[codes], index=series.index)
 
-        mask_sub = df_f["邀约专员/管家"]. astype(str).str.contains("小计|合计|总计", na=False)
-        df_store_data = df_f[mask_sub]. copy()
 
-        mask_bad = df_f["邀约专员/管家"].astype(str).str.strip().isin(["", "-", "—", "nan", "None"])
-        df_advisor_data = df_f[~mask_sub & ~mask_bad].copy()
+def _remove_brackets_vec(series):
+    return series.astype(str).str.replace(r'[（\(].*? [）\)]', '', regex=True)
 
-        for df in [df_store_data, df_advisor_data]:
-            if "线索量" in df.columns: df["线索量"] = pd.to_numeric(df["线索量"], errors="coerce").fillna(0)
-            else: df["线索量"] = 0.0
 
-            if "到店量" in df.columns: df["到店量"] = pd.to_numeric(df["到店量"], errors="coerce").fillna(0)
-            else: df["到店量"] = 0.0
+def _strict_clean_vec(series):
+    return series.astype(str).str.strip().str.replace(r'\s+', '', regex=True).str.lower().replace('nan', '')
 
-            if "Excel_Rate" in df.columns: 
-                clean_percent_col(df, "Excel_Rate")
-                df["线索到店率_数值"] = df["Excel_Rate"]
-            else:
-                num = pd.to_numeric(df["到店量"], errors="coerce").fillna(0)
-                denom = pd.to_numeric(df["线索量"], errors="coerce").fillna(0)
-                df["线索到店率_数值"] = (num / denom).replace([np.inf, -np.inf], 0).fillna(0)
-
-            df["线索到店率"] = (df["线索到店率_数值"] * 100).map("{:.1f}%".format)
-
-        store_qc_cols = ["质检总分", "S_60s", "S_Needs", "S_Car", "S_Policy", "S_Wechat", "S_Time"]
-        df_store_data. drop(columns=[c for c in store_qc_cols if c in df_store_data.columns], inplace=True, errors="ignore")
-
-        # ==========================================
-        # 2. 处理 DCC 顾问质检数据 (管家排名)
-        # ==========================================
-        df_d = raw_d. rename(columns={
-            "顾问名称": "邀约专员/管家", "管家": "邀约专员/管家", "质检总分": "质检总分",
-            "60秒通话": "S_60s", "用车需求": "S_Needs", "车型信息": "S_Car",
-            "政策相关": "S_Policy", "明确到店时间": "S_Time"
-        })
-        store_col_d = _pick_col_exact(raw_d, "门店名称") or _pick_any_col(raw_d, ["门店", "代理商"])
-        if store_col_d and store_col_d in df_d.columns:
-             df_d = df_d. rename(columns={store_col_d:  "门店名称"})
-        
-        if "门店名称" in df_d.columns:
-            df_d["门店名称"] = remove_brackets(df_d["门店名称"])
+
+def remove_brackets(series, memo=None):
+    if series is None:  return None
+    return map_unique(series, _remove_brackets_vec, memo)
+
+
+def strict_clean_str(series, memo=None):
+    return map_unique(series, _strict_clean_vec, memo)
+
+
+def factorize_keys(*series):
+    """把多列名称编码到同一套整数 ID（同名得同一 ID），按输入顺序返回；None 原样返回"""
+    present = [x for x in series if x is not None]
+    if not present:
+        return [None] * len(series)
+    codes, _ = pd.factorize(pd.concat(present, ignore_index=True), use_na_sentinel=False)
+    parts = iter(np.split(codes, np.cumsum([len(x) for x in present])[:-1]))
+    return [None if x is None else next(parts) for x in series]
+
+
+def _combined_ids(left, right, on):
+    """一或两个 ID 列合成单个 int64 键"""
+    if len(on) == 1:
+        return left[on[0]].to_numpy(), right[on[0]].to_numpy()
+    width = int(max(left[on[1]].to_numpy().max(initial=0), right[on[1]].to_numpy().max(initial=0))) + 1
+    return (
+        left[on[0]].to_numpy(np.int64) * width + left[on[1]].to_numpy(np.int64),
+        right[on[0]].to_numpy(np.int64) * width + right[on[1]].to_numpy(np.int64),
+    )
+
+
+def join_left(left, right, on, right_cols, suffixes=("_x", "_y"), label="", issues=None):
+    """按整数 ID 列左连接 right[right_cols]，结果与 pd.merge(how="left", suffixes=suffixes) 一致
+
+    right 的键唯一时用 get_indexer 一次定位；有重复键时按 merge 的一对多语义
+    重复左行，并把多出的行数记入 issues。
+    """
+    left_ids, right_ids = _combined_ids(left, right, on)
+    right_index = pd.Index(right_ids)
+    if right_index.is_unique:
+        rows = None
+        hits = right_index.get_indexer(left_ids)
+    else:
+        pairs = pd.DataFrame({"k": left_ids, "l": np.arange(len(left_ids))}).merge(
+            pd.DataFrame({"k": right_ids, "r": np.arange(len(right_ids))}), on="k", how="left"
+        )
+        rows = pairs["l"].to_numpy()
+        hits = pairs["r"].fillna(-1).to_numpy(np.int64)
+        if issues is not None and len(rows) > len(left):
+            issues.append(f"{label}：右表存在重复键，{len(rows) - len(left)} 行被重复匹配")
+
+    index = pd.RangeIndex(len(hits))
+    overlap = set(right_cols) & set(left.columns)
+    left_part = (left if rows is None else left.take(rows)).set_axis(index)
+    left_part.columns = [f"{c}{suffixes[0]}" if c in overlap else c for c in left.columns]
+    right_part = right[right_cols].reset_index(drop=True).reindex(hits).set_axis(index)
+    right_part.columns = [f"{c}{suffixes[1]}" if c in overlap else c for c in right_cols]
+    return pd.concat([left_part, right_part], axis=1)
+
+
+# ==========================================
+# 0. 准备归属映射表 (Store Mapping)
+# ==========================================
+def build_mapping(raw_m):
+    df_mapping = None
+    if raw_m is not None:
+        raw_m = raw_m.rename(columns=lambda x: str(x).strip())
         
-        df_d. columns = dedupe_columns(df_d.columns)
+        col_mgr = _pick_any_col(raw_m, ["区域经理", "大区经理"])
+        col_prov = _pick_any_col(raw_m, ["省份", "省"])
+        col_city = _pick_any_col(raw_m, ["城市", "市"])
+        col_store = _pick_any_col(raw_m, ["门店名称", "代理商", "经销商"])
+
+        if col_mgr and col_store:
+            df_mapping = raw_m[[col_store]].copy()
+            df_mapping. rename(columns={col_store: "门店名称"}, inplace=True)
+            
+            df_mapping["区域经理"] = raw_m[col_mgr] if col_mgr else "未知"
+            df_mapping["省份"] = raw_m[col_prov] if col_prov else "未知"
+            df_mapping["城市"] = raw_m[col_city] if col_city else "未知"
+            
+            df_mapping["门店名称"] = remove_brackets(df_mapping["门店名称"])
+            df_mapping["Join_Key"] = strict_clean_str(df_mapping["门店名称"])
+            df_mapping = df_mapping.drop_duplicates(subset=["Join_Key"])
+
+    return df_mapping
+
+
+# ==========================================
+# 1. 处理漏斗数据 (Funnel)
+# ==========================================
+def _funnel_leads_col(raw_f):
+    return "线上_有效线索数" if "线上_有效线索数" in raw_f.columns else ("线索量" if "线索量" in raw_f.columns else _pick_any_col(raw_f, ["有效线索", "线索数"]))
+
+
+def _funnel_visits_col(raw_f):
+    return "线上_到店数" if "线上_到店数" in raw_f. columns else ("到店量" if "到店量" in raw_f.columns else _pick_any_col(raw_f, ["到店数", "到店量"]))
+
+
+def clean_funnel(raw_f):
+    """返回 (门店小计行, 顾问明细行)"""
+    store_col_f = _pick_col_exact(raw_f, "代理商") or _pick_any_col(raw_f, ["门店", "经销商"]) or raw_f. columns[0]
+    name_col_f = _pick_any_col(raw_f, ["管家", "顾问", "邀约"]) or raw_f.columns[1]
+
+    col_leads = _funnel_leads_col(raw_f)
+    col_visits = _funnel_visits_col(raw_f)
+    col_excel_rate = _pick_any_col(raw_f, ["率"], exclude_keywords=["试驾", "成交"])
+
+    rename_dict_f = {store_col_f:  "门店名称", name_col_f:  "邀约专员/管家"}
+    if col_leads:  rename_dict_f[col_leads] = "线索量"
+    if col_visits: rename_dict_f[col_visits] = "到店量"
+    if col_excel_rate: rename_dict_f[col_excel_rate] = "Excel_Rate"
+
+    df_f = raw_f.rename(columns=rename_dict_f)
+    df_f. columns = dedupe_columns(df_f.columns)
+
+    if "门店名称" in df_f.columns:
+        df_f["门店名称"] = df_f["门店名称"].replace([r'^\s*$', 'nan', 'None'], np.nan, regex=True).ffill()
+        df_f["门店名称"] = remove_brackets(df_f["门店名称"])
+
+    mask_sub = df_f["邀约专员/管家"]. astype(str).str.contains("小计|合计|总计", na=False)
+    df_store_data = df_f[mask_sub]. copy()
+
+    mask_bad = df_f["邀约专员/管家"].astype(str).str.strip().isin(["", "-", "—", "nan", "None"])
+    df_advisor_data = df_f[~mask_sub & ~mask_bad].copy()
+
+    for df in [df_store_data, df_advisor_data]:
+        if "线索量" in df.columns: df["线索量"] = pd.to_numeric(df["线索量"], errors="coerce").fillna(0)
+        else: df["线索量"] = 0.0
+
+        if "到店量" in df.columns: df["到店量"] = pd.to_numeric(df["到店量"], errors="coerce").fillna(0)
+        else: df["到店量"] = 0.0
+
+        if "Excel_Rate" in df.columns: 
+            clean_percent_col(df, "Excel_Rate")
+            df["线索到店率_数值"] = df["Excel_Rate"]
+        else:
+            num = pd.to_numeric(df["到店量"], errors="coerce").fillna(0)
+            denom = pd.to_numeric(df["线索量"], errors="coerce").fillna(0)
+            df["线索到店率_数值"] = (num / denom).replace([np.inf, -np.inf], 0).fillna(0)
+
+        df["线索到店率"] = (df["线索到店率_数值"] * 100).map("{:.1f}%".format)
+
+    store_qc_cols = ["质检总分", "S_60s", "S_Needs", "S_Car", "S_Policy", "S_Wechat", "S_Time"]
+    df_store_data. drop(columns=[c for c in store_qc_cols if c in df_store_data.columns], inplace=True, errors="ignore")
+
+    return df_store_data, df_advisor_data
+
+
+# ==========================================
+# 2. 处理 DCC 顾问质检数据 (管家排名)
+# ==========================================
+DCC_RENAME_MAP = {
+    "顾问名称": "邀约专员/管家", "管家": "邀约专员/管家", "质检总分": "质检总分",
+    "60秒通话": "S_60s", "用车需求": "S_Needs", "车型信息": "S_Car",
+    "政策相关": "S_Policy", "明确到店时间": "S_Time"
+}
+
+
+def _dcc_wechat_cols(columns):
+    return [c for c in columns if ("微信" in str(c) and "添加" in str(c)) or ("添加微信" in str(c))]
+
+
+def clean_dcc(raw_d):
+    df_d = raw_d. rename(columns=DCC_RENAME_MAP)
+    store_col_d = _pick_col_exact(raw_d, "门店名称") or _pick_any_col(raw_d, ["门店", "代理商"])
+    if store_col_d and store_col_d in df_d.columns:
+         df_d = df_d. rename(columns={store_col_d:  "门店名称"})
+    
+    if "门店名称" in df_d.columns:
+        df_d["门店名称"] = remove_brackets(df_d["门店名称"])
+    
+    df_d. columns = dedupe_columns(df_d.columns)
+    
+    wechat_cols = _dcc_wechat_cols(df_d.columns)
+    df_d["S_Wechat"] = _to_1d_numeric(df_d[wechat_cols]) if wechat_cols else 0
+
+    score_cols = ["质检总分", "S_60s", "S_Needs", "S_Car", "S_Policy", "S_Wechat", "S_Time"]
+    for c in score_cols:
+        if c in df_d. columns:  df_d[c] = pd.to_numeric(df_d[c], errors="coerce")
+    
+    if "邀约专员/管家" not in df_d. columns:  df_d["邀约专员/管家"] = ""
+    cols_to_keep_d = ["邀约专员/管家"] + [c for c in score_cols if c in df_d.columns]
+    if "门店名称" in df_d.columns: cols_to_keep_d. append("门店名称")
+    df_d = df_d[cols_to_keep_d]
+
+    return df_d
+
+
+# ==========================================
+# 3. 处理 门店排名/质检数据
+# ==========================================
+def clean_store_rank(raw_s):
+    store_name_candidates = [c for c in raw_s.columns if ("门店" in str(c)) and ("ID" not in str(c))]
+    store_name_exact = _pick_col_exact(raw_s, "门店名称")
+    
+    if store_name_exact:  store_name = raw_s[store_name_exact].astype(str)
+    elif store_name_candidates: 
+        tmp = raw_s[store_name_candidates]
+        store_name = tmp.astype(str) if isinstance(tmp, pd. Series) else tmp.bfill(axis=1).iloc[:, 0]. astype(str)
+    else:  store_name = pd.Series(["" for _ in range(len(raw_s))])
         
-        wechat_cols = [c for c in df_d.columns if ("微信" in str(c) and "添加" in str(c)) or ("添加微信" in str(c))]
-        df_d["S_Wechat"] = _to_1d_numeric(df_d[wechat_cols]) if wechat_cols else 0
+    store_name = store_name.str.strip()
+    df_s = pd.DataFrame({"门店名称": store_name})
+
+    df_s["门店名称"] = remove_brackets(df_s["门店名称"])
+
+    col_map = {
+        "SR_质检总分": _pick_any_col(raw_s, ["质检总分", "总分"], exclude_keywords=["显示"]),
+        "SR_S_60s": _pick_any_col(raw_s, ["60秒", "60 秒"]),
+        "SR_S_Needs": _pick_any_col(raw_s, ["用车需求"]),
+        "SR_S_Car":  _pick_any_col(raw_s, ["车型信息"]),
+        "SR_S_Policy": _pick_any_col(raw_s, ["政策"]),
+        "SR_S_Time": _pick_any_col(raw_s, ["明确到店", "到店时间"]),
+        "SR_S_Wechat": _pick_any_col(raw_s, ["添加微信", "加微信"])
+    }
+
+    for new_col, raw_col in col_map.items():
+        if raw_col and raw_col in raw_s.columns:
+            df_s[new_col] = _to_1d_numeric(raw_s[raw_col])
+        else:
+            df_s[new_col] = np.nan
+
+    df_s["门店名称"] = df_s["门店名称"]. astype(str).str.strip()
+    df_s = df_s[df_s["门店名称"].ne("")]. copy()
+    df_s = df_s.drop_duplicates(subset=["门店名称"], keep="first")
+
+    return df_s
+
+
+# ==========================================
+# 4. 处理 AMS 数据
+# ==========================================
+AMS_RENAME_MAP = {
+    "管家姓名": "邀约专员/管家", "DCC平均通话时长": "通话时长", "DCC接通线索数": "conn_num",
+    "DCC外呼线索数": "conn_denom", "DCC及时处理线索": "timely_num", "需外呼线索数": "timely_denom",
+    "二次外呼线索数": "call2_num", "需再呼线索数":  "call2_denom", "DCC三次外呼的线索数": "call3_num",
+    "DCC二呼状态为需再呼的线索数": "call3_denom"
+}
+
 
-        score_cols = ["质检总分", "S_60s", "S_Needs", "S_Car", "S_Policy", "S_Wechat", "S_Time"]
-        for c in score_cols:
-            if c in df_d. columns:  df_d[c] = pd.to_numeric(df_d[c], errors="coerce")
+def clean_ams(raw_a):
+    df_a = raw_a.copy()
+    store_col_a = _pick_col_exact(raw_a, "代理商") or _pick_any_col(raw_a, ["门店", "经销商"])
+    if store_col_a:  df_a = df_a.rename(columns={store_col_a: "门店名称"})
+
+    if "门店名称" in df_a.columns:
+        df_a["门店名称"] = remove_brackets(df_a["门店名称"])
+
+    for src, tgt in AMS_RENAME_MAP.items():
+        if src in df_a. columns:  df_a = df_a.rename(columns={src:  tgt})
+
+    if "邀约专员/管家" not in df_a.columns: df_a["邀约专员/管家"] = ""
+    
+    for c in AMS_CALC_COLS + ["通话时长"]:
+        if c not in df_a. columns: df_a[c] = 0
+        df_a[c] = _to_1d_numeric(df_a[c])
+
+    return df_a
+
+
+# ==========================================
+# 5. 清洗与合并
+# ==========================================
+def merge_frames(df_store_data, df_advisor_data, df_d, df_a, df_s, issues=None):
+    """输入来自阶段缓存，先复制再原地清洗；连接中发现的重复键记入 issues"""
+    df_store_data, df_advisor_data, df_d, df_a, df_s = (
+        df.copy() for df in (df_store_data, df_advisor_data, df_d, df_a, df_s)
+    )
+
+    # 五张表共用同一份名称字典，每个不同的原始名称只清洗一次
+    store_keys, advisor_keys = {}, {}
+    frames = [df_store_data, df_advisor_data, df_d, df_a, df_s]
+    for df_x in frames: 
+        if "门店名称" in df_x. columns:  df_x["门店名称"] = strict_clean_str(df_x["门店名称"], store_keys)
+        if "邀约专员/管家" in df_x.columns: df_x["邀约专员/管家"] = strict_clean_str(df_x["邀约专员/管家"], advisor_keys)
+
+    # 清洗后的名称再编码为各表共用的整数 ID，下面的连接都按 ID 定位
+    id_cols = {"门店名称": "_store_id", "邀约专员/管家": "_advisor_id"}
+    for name_col, id_col in id_cols.items():
+        for df_x, ids in zip(frames, factorize_keys(*(df_x.get(name_col) for df_x in frames))):
+            if ids is not None: df_x[id_col] = ids
+
+    def payload(df_x, keys):
+        """连接时带入的列：去掉连接键及 ID 列"""
+        return [c for c in df_x.columns if c not in keys and c not in id_cols.values()]
+
+    full_advisors = df_advisor_data
+    if "邀约专员/管家" in df_d.columns:
+        cols_use_d = list(df_d. columns)
+        if "门店名称" in cols_use_d: df_d = df_d. rename(columns={"门店名称": "门店名称_dcc"})
+        full_advisors = join_left(full_advisors, df_d, ["_advisor_id"], payload(df_d, ["邀约专员/管家"]),
+                                  ("", "_dcc"), "顾问 ⟵ 质检表 (按管家)", issues)
+
+    cols_ams_needed = [c for c in AMS_CALC_COLS if c in df_a.columns] + ["通话时长"]
+    join_on = ["门店名称", "邀约专员/管家"] if ("门店名称" in df_a. columns and "门店名称" in full_advisors.columns) else ["邀约专员/管家"]
+    cols_for_merge = list(set(join_on + cols_ams_needed))
+    full_advisors = join_left(full_advisors, df_a, [id_cols[c] for c in join_on], payload(df_a[cols_for_merge], join_on),
+                              ("", "_ams"), "顾问 ⟵ AMS (按" + "+".join(join_on) + ")", issues)
+
+    for c in ["线索量", "到店量", "通话时长"] + AMS_CALC_COLS:
+        if c in full_advisors.columns: full_advisors[c] = pd.to_numeric(full_advisors[c], errors="coerce").fillna(0)
+
+    full_advisors["外呼接通率"] = safe_div(full_advisors, "conn_num", "conn_denom")
+    full_advisors["DCC及时处理率"] = safe_div(full_advisors, "timely_num", "timely_denom")
+    full_advisors["DCC二次外呼率"] = safe_div(full_advisors, "call2_num", "call2_denom")
+    full_advisors["DCC三次外呼率"] = safe_div(full_advisors, "call3_num", "call3_denom")
+
+    if "门店名称" in df_a.columns and len(AMS_CALC_COLS) > 0:
+         ams_store_agg = df_a.groupby("门店名称").agg({"_store_id": "first", **{c:"sum" for c in AMS_CALC_COLS}}).reset_index()
+         ams_store_agg["外呼接通率"] = safe_div(ams_store_agg, "conn_num", "conn_denom")
+         ams_store_agg["DCC及时处理率"] = safe_div(ams_store_agg, "timely_num", "timely_denom")
+         ams_store_agg["DCC二次外呼率"] = safe_div(ams_store_agg, "call2_num", "call2_denom")
+         ams_store_agg["DCC三次外呼率"] = safe_div(ams_store_agg, "call3_num", "call3_denom")
+         
+         full_stores = join_left(df_store_data, df_s, ["_store_id"], payload(df_s, ["门店名称"]), ("_x", "_y"), "门店 ⟵ 门店排名", issues)
+         full_stores = join_left(full_stores, ams_store_agg, ["_store_id"], payload(ams_store_agg, ["门店名称"]), ("_x", "_y"), "门店 ⟵ AMS 汇总", issues)
+    else:
+         full_stores = join_left(df_store_data, df_s, ["_store_id"], payload(df_s, ["门店名称"]), ("_x", "_y"), "门店 ⟵ 门店排名", issues)
+
+    for col in full_stores.columns:
+        if str(col).startswith("SR_"):
+            real_col = str(col).replace("SR_", "")
+            full_stores[real_col] = full_stores[col]
+    full_stores. drop(columns=[c for c in full_stores.columns if str(c).startswith("SR_")], inplace=True, errors="ignore")
+    full_stores. columns = dedupe_columns(full_stores.columns)
+
+    id_drop = list(id_cols.values())
+    return full_advisors.drop(columns=id_drop, errors="ignore"), full_stores.drop(columns=id_drop, errors="ignore")
+
+
+# ==========================================
+# 6. 注入归属信息 (Manager/Province/City)
+# ==========================================
+def inject_mapping(full_advisors, full_stores, df_mapping, issues=None):
+    """输入来自阶段缓存，先复制再注入；门店名称须已经过第 5 步清洗"""
+    full_advisors, full_stores = full_advisors.copy(), full_stores.copy()
+
+    if df_mapping is not None and not df_mapping.empty:
+        # 第 5 步已把门店名称清洗成连接键，与归属表的 Join_Key 编码为同一套整数 ID
+        df_mapping = df_mapping.copy()
+        full_stores["_store_id"], full_advisors["_store_id"], df_mapping["_store_id"] = factorize_keys(
+            full_stores["门店名称"], full_advisors["门店名称"], df_mapping["Join_Key"]
+        )
+        map_cols = [c for c in df_mapping.columns if c not in ("Join_Key", "_store_id")]
+
+        full_stores = join_left(full_stores, df_mapping, ["_store_id"], map_cols, ("", "_map"), "门店 ⟵ 归属表", issues)
+        for c in ["区域经理", "省份", "城市"]:
+            if f"{c}_map" in full_stores.columns:
+                full_stores[c] = full_stores[f"{c}_map"]. fillna("未知")
+            elif c in full_stores.columns:
+                 full_stores[c] = full_stores[c].fillna("未知")
+            else:
+                full_stores[c] = "未知"
         
-        if "邀约专员/管家" not in df_d. columns:  df_d["邀约专员/管家"] = ""
-        cols_to_keep_d = ["邀约专员/管家"] + [c for c in score_cols if c in df_d.columns]
-        if "门店名称" in df_d.columns: cols_to_keep_d. append("门店名称")
-        df_d = df_d[cols_to_keep_d]
-
-        # ==========================================
-        # 3. 处理 门店排名/质检数据
-        # ==========================================
-        store_name_candidates = [c for c in raw_s.columns if ("门店" in str(c)) and ("ID" not in str(c))]
-        store_name_exact = _pick_col_exact(raw_s, "门店名称")
+        full_stores.drop(columns=["_store_id"] + [c for c in full_stores. columns if c.endswith("_map")], inplace=True)
         
-        if store_name_exact:  store_name = raw_s[store_name_exact].astype(str)
-        elif store_name_candidates: 
-            tmp = raw_s[store_name_candidates]
-            store_name = tmp.astype(str) if isinstance(tmp, pd. Series) else tmp.bfill(axis=1).iloc[:, 0]. astype(str)
-        else:  store_name = pd.Series(["" for _ in range(len(raw_s))])
-            
-        store_name = store_name.str.strip()
-        df_s = pd.DataFrame({"门店名称": store_name})
-
-        df_s["门店名称"] = remove_brackets(df_s["门店名称"])
-
-        col_map = {
-            "SR_质检总分": _pick_any_col(raw_s, ["质检总分", "总分"], exclude_keywords=["显示"]),
-            "SR_S_60s": _pick_any_col(raw_s, ["60秒", "60 秒"]),
-            "SR_S_Needs": _pick_any_col(raw_s, ["用车需求"]),
-            "SR_S_Car":  _pick_any_col(raw_s, ["车型信息"]),
-            "SR_S_Policy": _pick_any_col(raw_s, ["政策"]),
-            "SR_S_Time": _pick_any_col(raw_s, ["明确到店", "到店时间"]),
-            "SR_S_Wechat": _pick_any_col(raw_s, ["添加微信", "加微信"])
-        }
-
-        for new_col, raw_col in col_map.items():
-            if raw_col and raw_col in raw_s.columns:
-                df_s[new_col] = _to_1d_numeric(raw_s[raw_col])
-            else:
-                df_s[new_col] = np.nan
-
-        df_s["门店名称"] = df_s["门店名称"]. astype(str).str.strip()
-        df_s = df_s[df_s["门店名称"].ne("")]. copy()
-        df_s = df_s.drop_duplicates(subset=["门店名称"], keep="first")
-
-        # ==========================================
-        # 4. 处理 AMS 数据
-        # ==========================================
-        df_a = raw_a.copy()
-        store_col_a = _pick_col_exact(raw_a, "代理商") or _pick_any_col(raw_a, ["门店", "经销商"])
-        if store_col_a:  df_a = df_a.rename(columns={store_col_a: "门店名称"})
-
-        if "门店名称" in df_a.columns:
-            df_a["门店名称"] = remove_brackets(df_a["门店名称"])
-
-        rename_map_ams = {
-            "管家姓名": "邀约专员/管家", "DCC平均通话时长": "通话时长", "DCC接通线索数": "conn_num",
-            "DCC外呼线索数": "conn_denom", "DCC及时处理线索": "timely_num", "需外呼线索数": "timely_denom",
-            "二次外呼线索数": "call2_num", "需再呼线索数":  "call2_denom", "DCC三次外呼的线索数": "call3_num",
-            "DCC二呼状态为需再呼的线索数": "call3_denom"
-        }
-        for src, tgt in rename_map_ams.items():
-            if src in df_a. columns:  df_a = df_a.rename(columns={src:  tgt})
-
-        if "邀约专员/管家" not in df_a.columns: df_a["邀约专员/管家"] = ""
+        full_advisors = join_left(full_advisors, df_mapping, ["_store_id"], map_cols, ("", "_map"), "顾问 ⟵ 归属表", issues)
+        for c in ["区域经理", "省份", "城市"]:
+            if f"{c}_map" in full_advisors.columns:
+                full_advisors[c] = full_advisors[f"{c}_map"]. fillna("未知")
+            elif c in full_advisors.columns:
+                full_advisors[c] = full_advisors[c]. fillna("未知")
+            else: 
+                full_advisors[c] = "未知"
         
-        all_ams_calc_cols = ["conn_num", "conn_denom", "timely_num", "timely_denom",
-                             "call2_num", "call2_denom", "call3_num", "call3_denom"]
-        for c in all_ams_calc_cols + ["通话时长"]:
-            if c not in df_a. columns: df_a[c] = 0
-            df_a[c] = _to_1d_numeric(df_a[c])
-
-        # ==========================================
-        # 5. 清洗与合并
-        # ==========================================
-        for df_x in [df_store_data, df_advisor_data, df_d, df_a, df_s]: 
-            if "门店名称" in df_x. columns:  df_x["门店名称"] = strict_clean_str(df_x["门店名称"])
-            if "邀约专员/管家" in df_x.columns: df_x["邀约专员/管家"] = strict_clean_str(df_x["邀约专员/管家"])
-
-        full_advisors = df_advisor_data. copy()
-        if "邀约专员/管家" in df_d.columns:
-            cols_use_d = list(df_d. columns)
-            if "门店名称" in cols_use_d: df_d = df_d. rename(columns={"门店名称": "门店名称_dcc"})
-            full_advisors = pd.merge(full_advisors, df_d, on="邀约专员/管家", how="left", suffixes=("", "_dcc"))
-
-        cols_ams_needed = [c for c in all_ams_calc_cols if c in df_a.columns] + ["通话时长"]
-        join_on = ["门店名称", "邀约专员/管家"] if ("门店名称" in df_a. columns and "门店名称" in full_advisors.columns) else ["邀约专员/管家"]
-        cols_for_merge = list(set(join_on + cols_ams_needed))
-        full_advisors = pd.merge(full_advisors, df_a[cols_for_merge], on=join_on, how="left", suffixes=("", "_ams"))
-
-        for c in ["线索量", "到店量", "通话时长"] + all_ams_calc_cols:
-            if c in full_advisors.columns: full_advisors[c] = pd.to_numeric(full_advisors[c], errors="coerce").fillna(0)
-
-        full_advisors["外呼接通率"] = safe_div(full_advisors, "conn_num", "conn_denom")
-        full_advisors["DCC及时处理率"] = safe_div(full_advisors, "timely_num", "timely_denom")
-        full_advisors["DCC二次外呼率"] = safe_div(full_advisors, "call2_num", "call2_denom")
-        full_advisors["DCC三次外呼率"] = safe_div(full_advisors, "call3_num", "call3_denom")
-
-        if "门店名称" in df_a.columns and len(all_ams_calc_cols) > 0:
-             ams_store_agg = df_a.groupby("门店名称").agg({c:"sum" for c in all_ams_calc_cols}).reset_index()
-             ams_store_agg["外呼接通率"] = safe_div(ams_store_agg, "conn_num", "conn_denom")
-             ams_store_agg["DCC及时处理率"] = safe_div(ams_store_agg, "timely_num", "timely_denom")
-             ams_store_agg["DCC二次外呼率"] = safe_div(ams_store_agg, "call2_num", "call2_denom")
-             ams_store_agg["DCC三次外呼率"] = safe_div(ams_store_agg, "call3_num", "call3_denom")
-             
-             full_stores = pd.merge(df_store_data, df_s, on="门店名称", how="left")
-             full_stores = pd.merge(full_stores, ams_store_agg, on="门店名称", how="left")
-        else:
-             full_stores = pd.merge(df_store_data, df_s, on="门店名称", how="left")
-
-        for col in full_stores.columns:
-            if str(col).startswith("SR_"):
-                real_col = str(col).replace("SR_", "")
-                full_stores[real_col] = full_stores[col]
-        full_stores. drop(columns=[c for c in full_stores.columns if str(c).startswith("SR_")], inplace=True, errors="ignore")
-        full_stores. columns = dedupe_columns(full_stores.columns)
-
-        # ==========================================
-        # 6. 注入归属信息 (Manager/Province/City)
-        # ==========================================
-        if df_mapping is not None and not df_mapping.empty:
-            full_stores["Join_Key"] = strict_clean_str(full_stores["门店名称"])
-            full_stores = pd.merge(full_stores, df_mapping, on="Join_Key", how="left", suffixes=("", "_map"))
-            for c in ["区域经理", "省份", "城市"]:
-                if f"{c}_map" in full_stores.columns:
-                    full_stores[c] = full_stores[f"{c}_map"]. fillna("未知")
-                elif c in full_stores.columns:
-                     full_stores[c] = full_stores[c].fillna("未知")
-                else:
-                    full_stores[c] = "未知"
-            
-            full_stores.drop(columns=["Join_Key"] + [c for c in full_stores. columns if c.endswith("_map")], inplace=True)
-            
-            full_advisors["Join_Key"] = strict_clean_str(full_advisors["门店名称"])
-            full_advisors = pd.merge(full_advisors, df_mapping, on="Join_Key", how="left", suffixes=("", "_map"))
-            for c in ["区域经理", "省份", "城市"]:
-                if f"{c}_map" in full_advisors.columns:
-                    full_advisors[c] = full_advisors[f"{c}_map"]. fillna("未知")
-                elif c in full_advisors.columns:
-                    full_advisors[c] = full_advisors[c]. fillna("未知")
-                else: 
-                    full_advisors[c] = "未知"
-            
-            full_advisors.drop(columns=["Join_Key"] + [c for c in full_advisors.columns if c.endswith("_map")], inplace=True)
+        full_advisors.drop(columns=["_store_id"] + [c for c in full_advisors.columns if c.endswith("_map")], inplace=True)
+    else:
+        for df in [full_stores, full_advisors]:
+            df["区域经理"] = "未知"
+            df["省份"] = "未知"
+            df["城市"] = "未知"
+
+    return full_advisors, full_stores
+
+
+# ==========================================
+# 7. 顾问诊断规则 (Diagnosis Rules)
+# ==========================================
+# (得分列, 短板阈值, 计入优秀判定, 名称, 建议, 图标)；顺序即诊断建议的展示顺序
+DIAG_RULES = [
+    ("S_60s", 60, False, "60秒占比", "开场先抛利益点 + 明确下一步动作。", "🟠"),
+    ("S_Time", 80, True, "明确到店", "建议使用二选一法锁定时间。", "🔴"),
+    ("S_Wechat", 80, True, "添加微信", "建议以发定位/资料为由加微。", "🔴"),
+    ("S_Needs", 80, True, "用车需求", "需加强需求挖掘，至少问清场景/预算/家庭结构。", "🔴"),
+    ("S_Car", 80, True, "车型信息", "需提升产品讲解链路，先讲1-2个强卖点。", "🔴"),
+    ("S_Policy", 80, True, "政策相关", "需准确传达政策，并用截止时间推动决策。", "🔴"),
+]
+DIAG_EXCELLENT = 85
+DIAG_TIERS = ["重点辅导", "待提升", "优秀", "无质检"]
+DIAG_LABELS = {col: name for col, _, _, name, _, _ in DIAG_RULES}
+
+def diagnose_advisors(full_advisors):
+    """对全部顾问一次性执行诊断规则
+
+    新增列：Flag_<得分列>（是否短板）、短板数、诊断等级 (DIAG_TIERS)、
+    建议码（短板的得分列，逗号分隔）。缺失的单项得分按 0 分计。
+    """
+    df = full_advisors
+    total = pd.to_numeric(df["质检总分"], errors="coerce") if "质检总分" in df.columns else pd.Series(np.nan, index=df.index)
+    has_score = total.notna() & (total != 0)
+
+    n_flags = pd.Series(0, index=df.index, dtype="int8")
+    excellent = pd.Series(True, index=df.index)
+    codes = pd.Series("", index=df.index, dtype=object)
+    for col, threshold, counts_for_excellent, _, _, _ in DIAG_RULES:
+        score = pd.to_numeric(df[col], errors="coerce").fillna(0) if col in df.columns else pd.Series(0.0, index=df.index)
+        flag = has_score & (score < threshold)
+        df[f"Flag_{col}"] = flag
+        n_flags += flag.astype("int8")
+        codes += np.where(flag, f"{col},", "")
+        if counts_for_excellent:
+            excellent &= score >= DIAG_EXCELLENT
+
+    tier = np.select([~has_score, n_flags > 0, excellent], ["无质检", "重点辅导", "优秀"], "待提升")
+    df["短板数"] = n_flags
+    df["诊断等级"] = pd.Categorical(tier, categories=DIAG_TIERS)
+    df["建议码"] = codes.str.rstrip(",")
+    return df
+
+
+# ==========================================
+# 8. 预计算排名 (Ranks)
+# ==========================================
+# 门店：全国及区域经理/省份/城市任意组合内的排名，与多维视图的筛选组合一一对应，
+# 例如同时选了经理和省份时用 排名_区域经理_省份；顾问：全国及门店内的排名
+STORE_RANK_LEVELS = ("区域经理", "省份", "城市")
+STORE_RANK_SCOPES = {"排名_全国": None}
+STORE_RANK_SCOPES.update(
+    ("排名_" + "_".join(levels), levels)
+    for n in range(1, len(STORE_RANK_LEVELS) + 1)
+    for levels in itertools.combinations(STORE_RANK_LEVELS, n)
+)
+ADVISOR_RANK_SCOPES = {"排名_全国": None, "排名_门店": ("门店名称",)}
+
+
+def store_rank_col(sel_mgr, sel_prov, sel_city) -> str:
+    """当前筛选组合对应的门店排名列"""
+    levels = [level for level, sel in zip(STORE_RANK_LEVELS, (sel_mgr, sel_prov, sel_city)) if sel != "全部"]
+    return "排名_" + "_".join(levels) if levels else "排名_全国"
+
+
+def rank_frame(df, scopes):
+    """按线索到店率降序排名（无数据排最后），同分按行序，各视图名次一致"""
+    if "线索到店率_数值" not in df.columns:
+        return df
+    sort_score = pd.to_numeric(df["线索到店率_数值"], errors="coerce").fillna(-1)
+    for rank_col, group_cols in scopes.items():
+        if group_cols is None:
+            ranks = sort_score.rank(method="first", ascending=False)
+        elif all(c in df.columns for c in group_cols):
+            keys = [df[c] for c in group_cols]
+            ranks = sort_score.groupby(keys, observed=True, dropna=False).rank(method="first", ascending=False)
         else:
-            for df in [full_stores, full_advisors]:
-                df["区域经理"] = "未知"
-                df["省份"] = "未知"
-                df["城市"] = "未知"
+            continue
+        df[rank_col] = ranks.astype("int32")
+    return df
 
-        return full_advisors, full_stores
 
-    except Exception as e: 
-        st.error(f"处理出错:  {e}")
-        st.text(traceback.format_exc())
-        return None, None
+CATEGORY_COLS = ["门店名称", "邀约专员/管家", "区域经理", "省份", "城市", "线索到店率"]
+COUNT_COLS = ["线索量", "到店量"] + AMS_CALC_COLS
+RATE_COLS = ["线索到店率_数值", "Excel_Rate", "外呼接通率", "DCC及时处理率", "DCC二次外呼率", "DCC三次外呼率"]
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """名称类列转 category，计数转 int32，比率转 float32，缩小缓存与会话副本"""
+    for c in CATEGORY_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    for c in COUNT_COLS:
+        if c in df.columns:
+            col = pd.to_numeric(df[c], errors="coerce")
+            is_int = col.notna().all() and (col % 1 == 0).all() and col.abs().max() < 2**31
+            df[c] = col.astype("int32" if is_int else "float32")
+    for c in RATE_COLS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+    return df
+
+
+KPI_SUM_COLS = ["线索量", "到店量"] + AMS_CALC_COLS
+
+
+def _rollup(df: pd.DataFrame, by) -> pd.DataFrame:
+    """按 by 分组求分子/分母之和，以及质检总分的和与计数"""
+    work = df[[c for c in KPI_SUM_COLS if c in df.columns]].astype("float64")
+    score = pd.to_numeric(df["质检总分"], errors="coerce") if "质检总分" in df.columns else pd.Series(np.nan, index=df.index)
+    work["score_sum"] = score.fillna(0)
+    work["score_cnt"] = score.notna().astype("int64")
+    if not by:
+        return work.sum().to_frame().T
+    return work.groupby([df[b] for b in by], observed=True, dropna=False).sum().reset_index()
+
+
+def build_kpi_cube(full_advisors: pd.DataFrame, full_stores: pd.DataFrame) -> pd.DataFrame:
+    """各层级预聚合的 KPI 立方体，索引为 (层级, k1, k2, k3)
+
+    ("stores", 经理, 省份, 城市)：门店视图，任一级可为 "全部"
+    ("store", 门店, "", "")：选中门店后该店顾问的汇总
+    ("advisor", 门店, 顾问, "")：单个顾问
+    """
+    levels = ["区域经理", "省份", "城市"]
+    parts = []
+    for keep in itertools.product((True, False), repeat=3):
+        agg = _rollup(full_stores, [l for l, k in zip(levels, keep) if k])
+        for l, k in zip(levels, keep):
+            if not k:
+                agg[l] = "全部"
+        parts.append(agg.rename(columns=dict(zip(levels, ["k1", "k2", "k3"]))).assign(level="stores"))
+
+    store_agg = _rollup(full_advisors, ["门店名称"]).rename(columns={"门店名称": "k1"})
+    parts.append(store_agg.assign(level="store", k2="", k3=""))
+    advisor_agg = _rollup(full_advisors, ["门店名称", "邀约专员/管家"]).rename(columns={"门店名称": "k1", "邀约专员/管家": "k2"})
+    parts.append(advisor_agg.assign(level="advisor", k3=""))
+
+    cube = pd.concat(parts, ignore_index=True)
+    for c in ["k1", "k2", "k3"]:
+        cube[c] = cube[c].astype(object)
+    return cube.set_index(["level", "k1", "k2", "k3"]).sort_index()
+
+
+def kpi_lookup(kpi_cube: pd.DataFrame, key) -> dict:
+    """取立方体中的一行；该层级没有数据时返回空 dict"""
+    try:
+        row = kpi_cube.loc[key]
+    except KeyError:
+        return {}
+    if isinstance(row, pd.DataFrame):
+        row = row.iloc[0]
+    return row.to_dict()
+
+
+def kpi_ratio(kpi: dict, num: str, denom: str) -> float:
+    total_denom = kpi.get(denom, 0)
+    return kpi.get(num, 0) / total_denom if total_denom > 0 else 0
+
+
+def kpi_delta(current, previous, fmt: str):
+    """环比变化的显示文本；没有上期数据时返回 None，st.metric 不显示 delta"""
+    if previous is None or pd.isna(previous) or pd.isna(current):
+        return None
+    return format(current - previous, fmt)
+
+
+# --- Upload Validation ---
+
+def _exact_col(name):
+    return lambda h: _pick_col_exact(h, name)
+
+
+# 上传前的表头检查 {报表: (名称, 是否门店排名表, [(缺失项说明, 选列函数)])}
+# 选列函数与各清洗步骤的选列逻辑一致，作用于只含列名的空表；任一项选不到即拒收
+UPLOAD_SCHEMAS = {
+    "funnel": ("漏斗指标表", False, [
+        ("门店/代理商列", lambda h: _pick_col_exact(h, "代理商") or _pick_any_col(h, ["门店", "经销商"])),
+        ("邀约专员/管家列", lambda h: _pick_any_col(h, ["管家", "顾问", "邀约"])),
+        ("线索量列", _funnel_leads_col),
+        ("到店量列", _funnel_visits_col),
+    ]),
+    "dcc": ("顾问质检表", False, [
+        ("顾问名称/管家", lambda h: _pick_col_exact(h, "顾问名称") or _pick_col_exact(h, "管家")),
+        *[(c, _exact_col(c)) for c in ["质检总分", "60秒通话", "用车需求", "车型信息", "政策相关", "明确到店时间"]],
+        ("添加微信", lambda h: _dcc_wechat_cols(h.columns)),
+    ]),
+    "ams": ("AMS跟进表", False, [
+        ("门店/代理商列", lambda h: _pick_col_exact(h, "代理商") or _pick_any_col(h, ["门店", "经销商"])),
+        *[(c, _exact_col(c)) for c in AMS_RENAME_MAP],
+    ]),
+    "store_rank": ("门店排名表", True, [
+        ("门店名称列", lambda h: [c for c in h.columns if "门店" in str(c) and "ID" not in str(c)]),
+        ("质检总分列", lambda h: _pick_any_col(h, ["质检总分", "总分"], exclude_keywords=["显示"])),
+    ]),
+    "mapping": ("代理商归属表", False, [
+        ("区域经理列", lambda h: _pick_any_col(h, ["区域经理", "大区经理"])),
+        ("门店名称/代理商列", lambda h: _pick_any_col(h, ["门店名称", "代理商", "经销商"])),
+    ]),
+}
+
+
+def validate_upload(source, report: str) -> list:
+    """只读取表头区域检查必需列，返回问题描述列表（为空表示通过）"""
+    label, is_rank_file, checks = UPLOAD_SCHEMAS[report]
+    try:
+        names = read_header(source, is_rank_file)
+    except Exception as e:
+        return [f"{label}：无法读取 ({e})"]
+    if names is None:
+        return [f"{label}：无法识别表头"]
+
+    header = pd.DataFrame(columns=names)
+    missing = [desc for desc, pick in checks if not pick(header)]
+    return [f"{label}：缺少 {'、'.join(missing)}"] if missing else []
+
+
+# --- Stage Cache ---
+
+_STAGE_MISS = object()
+
+
+@st.cache_resource
+def _stage_cache():
+    """各处理阶段最近一次的结果 {阶段: (输入指纹, 结果)}，跨会话共享"""
+    return {"lock": threading.Lock(), "results": {}}
+
+
+def _stage_get(name: str, key):
+    cache = _stage_cache()
+    with cache["lock"]:
+        hit = cache["results"].get(name)
+    if hit is None or hit[0] != key:
+        return _STAGE_MISS
+    return hit[1]
+
+
+def _stage_put(name: str, key, value):
+    cache = _stage_cache()
+    with cache["lock"]:
+        cache["results"][name] = (key, value)
+    return value
+
+
+def _stage_key(path):
+    fp = file_fingerprint(path)
+    return PIPELINE_VERSION, fp[2] if fp else None
+
+
+def build_frames(path_f, path_d, path_a, path_s, path_m, perf=None):
+    """按阶段生成 (full_advisors, full_stores)，只重算输入发生变化的阶段
+
+    每个阶段以其输入文件的指纹为键缓存最近一次结果。例如只替换归属表时，
+    只会重新读取归属表，并对缓存的合并结果重新执行第 6 步。
+    perf 为性能记录：各步骤计时，命中缓存的阶段记入 perf["cached"]。
+    出错时直接抛出，由调用方显示；失败结果不进入任何缓存，下次运行会重试。
+    """
+    stage_inputs = {
+        "funnel": (path_f, False, clean_funnel, "1. 漏斗数据"),
+        "dcc": (path_d, False, clean_dcc, "2. DCC 质检"),
+        "ams": (path_a, False, clean_ams, "4. AMS 跟进"),
+        "store_rank": (path_s, True, clean_store_rank, "3. 门店排名"),
+        "mapping": (path_m, False, build_mapping, "0. 归属映射"),
+    }
+    keys = {name: _stage_key(spec[0]) for name, spec in stage_inputs.items()}
+    merge_key = tuple(keys[n] for n in ("funnel", "dcc", "ams", "store_rank"))
+
+    merged = _stage_get("merge", merge_key)
+    needed = ["mapping"] if merged is not _STAGE_MISS else list(stage_inputs)
+    results = {name: _stage_get(name, keys[name]) for name in needed}
+    missing = [name for name in needed if results[name] is _STAGE_MISS]
+    if perf is not None:
+        perf["cached"] += [stage_inputs[n][3] for n in needed if n not in missing]
+        if merged is not _STAGE_MISS:
+            perf["cached"].append("5. 清洗与合并")
+
+    # 缺失的阶段一起并发读取
+    raws = read_reports([(*stage_inputs[name][:2], keys[name][1]) for name in missing], perf)
+    for name, raw in zip(missing, raws):
+        _, _, clean, label = stage_inputs[name]
+        # 读取失败可能是暂时的（文件正在写入等），不缓存
+        results[name] = None if raw is None else _stage_put(name, keys[name], perf_stage(perf, label, clean, raw))
+
+    if merged is _STAGE_MISS:
+        unreadable = [n for n in ("funnel", "dcc", "ams", "store_rank") if results[n] is None]
+        if unreadable:
+            raise ValueError("无法读取或识别表头: " + ", ".join(stage_inputs[n][3] for n in unreadable))
+        df_store_data, df_advisor_data = results["funnel"]
+        merge_issues = []
+        merged = _stage_put("merge", merge_key, (perf_stage(
+            perf, "5. 清洗与合并", merge_frames,
+            df_store_data, df_advisor_data, results["dcc"], results["ams"], results["store_rank"], merge_issues,
+        ), merge_issues))
+
+    # 合并阶段发现的重复键随缓存结果一起保存，命中缓存时也能看到
+    merged, merge_issues = merged
+    issues = list(merge_issues)
+    full_advisors, full_stores = perf_stage(perf, "6. 注入归属", inject_mapping, *merged, results["mapping"], issues)
+    if perf is not None:
+        perf["warnings"] = issues
+    full_advisors = perf_stage(perf, "7. 顾问诊断", diagnose_advisors, full_advisors)
+    full_advisors, full_stores = perf_stage(
+        perf, "8. 预计算排名",
+        lambda: (rank_frame(full_advisors, ADVISOR_RANK_SCOPES), rank_frame(full_stores, STORE_RANK_SCOPES)),
+    )
+    return perf_stage(perf, "压缩列类型", lambda: (compact_frame(full_advisors), compact_frame(full_stores)))
+
+
+# --- View Index ---
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_hierarchy_index(fingerprint, _df_stores):
+    """四级联动筛选的层级索引，每个数据集 (fingerprint) 只构建一次
+
+    用 cache_resource 直接共享同一份索引，避免每次重跑反序列化整份字典；
+    索引只读，调用方不要修改。
+
+    rows[(经理, 省份, 城市)]：该组合下门店在 df_stores 中的行号（任一级可为 "全部"）
+    options[()] / [(经理,)] / [(经理, 省份)] / [(经理, 省份, 城市)]：
+        下一级选择框的有序选项（不含 "全部"）
+    """
+    def column_values(col):
+        if col not in _df_stores.columns:
+            return [None] * len(_df_stores)
+        return [None if pd.isna(v) else str(v) for v in _df_stores[col]]
+
+    mgrs, provs, cities, stores = (column_values(c) for c in ("区域经理", "省份", "城市", "门店名称"))
+
+    positions = {}
+    for i, (m, p, c) in enumerate(zip(mgrs, provs, cities)):
+        for key in itertools.product((m, "全部"), (p, "全部"), (c, "全部")):
+            positions.setdefault(key, []).append(i)
+
+    def sorted_options(values, rows):
+        return sorted({values[i] for i in rows if values[i] is not None})
+
+    rows, options = {}, {(): sorted({m for m in mgrs if m is not None})}
+    for (m, p, c), pos in positions.items():
+        rows[(m, p, c)] = np.asarray(pos, dtype=np.intp)
+        if p == "全部" and c == "全部":
+            options[(m,)] = sorted_options(provs, pos)
+        if c == "全部":
+            options[(m, p)] = sorted_options(cities, pos)
+        options[(m, p, c)] = sorted_options(stores, pos)
+    return {"rows": rows, "options": options}
+
+
+# --- Charts ---
+
+# 点数超过该值改用 WebGL (Scattergl) 渲染
+SCATTER_WEBGL_ROWS = 1000
+# 点数超过该值先按 x/y 分箱聚合成密度格子，控制图表 JSON 体积
+SCATTER_DENSITY_ROWS = 20000
+SCATTER_DENSITY_BINS = 60
+
+
+def _density_cells(df: pd.DataFrame, x: str, y: str, bins: int) -> pd.DataFrame:
+    """按 x/y 等宽分箱聚合：位置取格内均值，线索量求和，质检分取均值"""
+    cells = (
+        df.assign(
+            _xi=pd.cut(df[x].astype(float), bins, labels=False),
+            _yi=pd.cut(df[y].astype(float), bins, labels=False),
+        )
+        .groupby(["_xi", "_yi"], observed=True, sort=False)
+        .agg(**{
+            x: (x, "mean"),
+            y: (y, "mean"),
+            "线索量": ("线索量", "sum"),
+            "质检总分_显示": ("质检总分_显示", "mean"),
+            "点数": (x, "size"),
+        })
+        .reset_index(drop=True)
+    )
+    cells["名称"] = cells["点数"].astype(str) + " 个对象"
+    return cells
+
+
+def scatter_chart(df: pd.DataFrame, x: str, y: str, color_scale: str, height: int, labels=None):
+    """气泡散点图：只带绘图需要的列，点多时切换 WebGL，再多则聚合为密度格子"""
+    data = df[["名称", x, y, "线索量", "质检总分_显示"]].dropna(subset=[x, y])
+    hover_data = None
+    if len(data) > SCATTER_DENSITY_ROWS:
+        data = _density_cells(data, x, y, SCATTER_DENSITY_BINS)
+        hover_data = {"点数": True}
+    return px.scatter(
+        data, x=x, y=y,
+        size="线索量", color="质检总分_显示", hover_name="名称", hover_data=hover_data,
+        color_continuous_scale=color_scale, height=height, labels=labels,
+        render_mode="webgl" if len(data) > SCATTER_WEBGL_ROWS else "auto",
+    )
+
+
+RANK_PAGE_SIZE = 15
+
+
+def rank_page(df: pd.DataFrame, rank_col: str, page: int) -> pd.DataFrame:
+    """按预计算的排名取第 page 页，只做部分选择，不对整表排序"""
+    return df.nsmallest(page * RANK_PAGE_SIZE, rank_col).iloc[(page - 1) * RANK_PAGE_SIZE:]
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def cached_figure(key: tuple, _builder):
+    """按 (数据指纹, 四级筛选, 图表 id, 横轴指标) 缓存图表，切回看过的视图直接复用
+
+    超出 max_entries 时淘汰最久未用的；图表对象在会话间共享，调用方不得修改。
+    """
+    return _builder()
+
+
+# --- Fragments ---
+# 以下片段各自独立重跑：切换横轴或顾问时不再重算筛选、汇总和其他图表
+
+@st.fragment
+def attribution_chart(plot_df_vis: pd.DataFrame, fig_key: tuple):
+    """归因分析图：过程指标 vs 线索到店率，横轴可切换"""
+    x_axis_choice = st.radio("选择横轴指标：", ["DCC及时处理率", "DCC二次外呼率", "DCC三次外呼率"], horizontal=True)
+    
+    if x_axis_choice in plot_df_vis. columns:
+        def build_fig_p2():
+            fig_p2 = scatter_chart(plot_df_vis, x_axis_choice, "线索到店率_显示", "Blues", 300)
+            fig_p2.update_layout(xaxis=dict(tickformat=".0%"), yaxis=dict(tickformat=".1%"))
+            return fig_p2
+        fig_p2 = cached_figure(fig_key + ("attribution", x_axis_choice), build_fig_p2)
+        st.plotly_chart(fig_p2, use_container_width=True)
+    else: st. warning("数据不足")
+
+
+@st.fragment
+def advisor_diagnosis_panel(diag_df: pd.DataFrame):
+    """单个顾问的漏斗、质检得分与诊断建议；diag_df 为当前门店的顾问明细"""
+    diag_list = sorted(diag_df["邀约专员/管家"].dropna().astype(str).unique())
+
+    if diag_list: 
+        sel_p = st.selectbox("🔍 选择该店邀约专员/管家：", diag_list)
+        p_row = diag_df[diag_df["邀约专员/管家"] == sel_p]
+
+        if not p_row. empty:
+            p = p_row.iloc[0]
+
+            d1, d2, d3 = st.columns([1,1,1.2])
+
+            with d1:
+                st.caption("转化漏斗 (RESULT)")
+                leads = float(pd.to_numeric(p. get("线索量", 0), errors="coerce") or 0)
+                visits = float(pd. to_numeric(p.get("到店量", 0), errors="coerce") or 0)
+
+                fig_f = go.Figure(
+                    go.Funnel(
+                        y=["线索量", "到店量"],
+                        x=[leads, visits],
+                        textinfo="value+percent initial",
+                        marker={"color": ["#d9d9d9", "#bb0a30"]},
+                    )
+                )
+                fig_f.update_layout(showlegend=False, height=180, margin=dict(t=0, b=0, l=0, r=0))
+                st.plotly_chart(fig_f, use_container_width=True)
+
+                st.metric("线索到店率", p.get("线索到店率", "0.0%"))
+
+                avg_call_dur = float(pd.to_numeric(p.get("通话时长", 0), errors="coerce") or 0)
+                st.caption(f"平均通话时长: {avg_call_dur:.1f} 秒")
+
+            # 诊断结果已由 diagnose_advisors 对全部顾问预先算好
+            has_score = p.get("诊断等级") != "无质检"
+
+            with d2:
+                st.caption("质检得分详情 (QUALITY)")
+                if has_score: 
+                    metrics = {
+                        "明确到店时间": p.get("S_Time", np.nan),
+                        "60秒通话占比": p.get("S_60s", np.nan),
+                        "用车需求": p.get("S_Needs", np.nan),
+                        "车型信息介绍": p. get("S_Car", np.nan),
+                        "政策相关话术": p.get("S_Policy", np.nan),
+                        "添加微信": p.get("S_Wechat", np. nan),
+                    }
+
+                    for k, v in metrics.items():
+                        val = 0 if pd. isna(v) else float(v)
+                        c_a, c_b = st.columns([3,1])
+                        c_a.progress(min(val / 100,1.0))
+                        c_b.write(f"{val:.0f}")
+                        st.caption(k)
+                else: 
+                    st. warning("暂无质检数据")
+
+            with d3:
+                if has_score: 
+                    st.error("🤖 诊断建议")
+
+                    if p["诊断等级"] == "重点辅导":
+                        for col, _, _, name, advice, icon in DIAG_RULES:
+                            if p[f"Flag_{col}"]:
+                                score = 0 if pd.isna(p.get(col, np.nan)) else float(p.get(col))
+                                st.markdown(f"{icon} **{name} (得分{score:.1f})** {advice}")
+                        st.warning("⚠️ 存在明显短板，请重点辅导。")
+                    elif p["诊断等级"] == "优秀":
+                        st.success("🌟 各项指标表现优秀！")
+                    else: 
+                        st. info("✅ 各项指标合格，但仍有提升空间。")
+                else: 
+                    st.info("暂无数据，无法生成诊断建议。")
+    else: 
+        st.warning("该门店下暂无数据。")
 
 
 # --- UI Layout ---
@@ -608,8 +2312,17 @@ with st.sidebar:
     op_data_ready = os.path.exists(PATH_F) and os.path. exists(PATH_D) and os.path. exists(PATH_A) and (store_rank_path is not None)
     
     # 显示 GitHub 同步状态
-    if GH_TOKEN and GH_DATA_REPO: 
-        st.success("☁️ 云同步：已启用")
+    if not startup_sync["done"].is_set():
+        wait_for_startup_sync()
+    elif GH_TOKEN and GH_DATA_REPO: 
+        upload_status = get_upload_status()
+        if upload_status["error"]:
+            st.warning(f"☁️ 云同步：{upload_status['pending']} 个文件待上传，"
+                       f"已重试 {upload_status['attempts']} 次（{upload_status['error']}），稍后自动重试")
+        elif upload_status["pending"]:
+            st.info(f"☁️ 云同步：{upload_status['pending']} 个文件正在后台上传...")
+        else:
+            st.success("☁️ 云同步：已启用")
     else:
         st.warning("☁️ 云同步：未配置")
     
@@ -628,7 +2341,7 @@ with st.sidebar:
     with st.expander("🔐 更新数据 (仅限管理员)"):
         pwd = st.text_input("输入管理员密码", type="password")
         if pwd == ADMIN_PASSWORD: 
-            tab1, tab2 = st.tabs(["📊 更新业务数据", "🗺️ 更新归属关系"])
+            tab1, tab2, tab3 = st.tabs(["📊 更新业务数据", "🗺️ 更新归属关系", "⏱️ 性能诊断"])
             
             with tab1:
                 st.info("请上传本次考评周期的 4 个业务报表：")
@@ -639,34 +2352,35 @@ with st.sidebar:
 
                 if st.button("🚀 提交业务数据"):
                     if new_f and new_d and new_a and new_s:
-                        with st.spinner("正在保存业务数据..."):
-                            save_uploaded_file(new_f, PATH_F)
-                            save_uploaded_file(new_d, PATH_D)
-                            save_uploaded_file(new_a, PATH_A)
+                        # 只读表头检查必需列，任一文件不合格则不做任何保存
+                        problems = [p for up, report in [(new_f, "funnel"), (new_d, "dcc"), (new_a, "ams"), (new_s, "store_rank")]
+                                    for p in validate_upload(up, report)]
+                        if problems:
+                            st.error("以下文件未通过检查，本次未保存任何数据：\n\n" + "\n".join(f"- {p}" for p in problems))
+                        else:
+                            with st.spinner("正在保存业务数据..."):
+                                save_uploaded_file(new_f, PATH_F)
+                                save_uploaded_file(new_d, PATH_D)
+                                save_uploaded_file(new_a, PATH_A)
                             
-                            if str(new_s.name).lower().endswith(".xlsx"):
-                                if os.path.exists(PATH_S_CSV): os.remove(PATH_S_CSV)
-                                save_uploaded_file(new_s, PATH_S_XLSX)
-                            else:
-                                if os.path.exists(PATH_S_XLSX): os.remove(PATH_S_XLSX)
-                                save_uploaded_file(new_s, PATH_S_CSV)
-
-                            try:
-                                with open(LAST_UPDATE_FILE, "w", encoding="utf-8") as f:
-                                    f.write(datetime.now().isoformat(timespec="seconds"))
-                            except Exception:  pass
+                                if str(new_s.name).lower().endswith(".xlsx"):
+                                    remove_report(PATH_S_CSV)
+                                    save_uploaded_file(new_s, PATH_S_XLSX, is_rank_file=True)
+                                else:
+                                    remove_report(PATH_S_XLSX)
+                                    save_uploaded_file(new_s, PATH_S_CSV, is_rank_file=True)
+
+                                try:
+                                    with open(LAST_UPDATE_FILE, "w", encoding="utf-8") as f:
+                                        f.write(datetime.now().isoformat(timespec="seconds"))
+                                except Exception:  pass
                             
-                            # 上传到 GitHub
-                            if GH_TOKEN and GH_DATA_REPO:
-                                with st.spinner("正在同步到云端..."):
-                                    if upload_all_to_github():
-                                        st.success("☁️ 已同步到云端")
-                                    else:
-                                        st.warning("☁️ 云同步失败，但本地数据已保存")
-                        
-                        process_data. clear()
-                        st.success("更新完成，正在刷新...")
-                        st.rerun()
+                                # 后台上传到 GitHub，不阻塞页面
+                                if GH_TOKEN and GH_DATA_REPO:
+                                    upload_all_to_github()
+
+                            st.success("更新完成，正在刷新...")
+                            st.rerun()
                     else:
                         st.error("请传齐 4 个业务文件")
             
@@ -676,29 +2390,71 @@ with st.sidebar:
                 
                 if st.button("💾 保存归属关系"):
                     if new_m: 
-                        with st. spinner("正在保存归属表..."):
-                            save_uploaded_file(new_m, PATH_M)
+                        problems = validate_upload(new_m, "mapping")
+                        if problems:
+                            st.error(problems[0])
+                        else:
+                            with st. spinner("正在保存归属表..."):
+                                save_uploaded_file(new_m, PATH_M)
                             
-                            # 上传到 GitHub
-                            if GH_TOKEN and GH_DATA_REPO:
-                                with st.spinner("正在同步到云端..."):
-                                    if upload_mapping_to_github():
-                                        st.success("☁️ 已同步到云端")
-                                    else:
-                                        st.warning("☁️ 云同步失败，但本地数据已保存")
-                        
-                        process_data.clear()
-                        st.success("归属关系已更新！")
-                        st.rerun()
+                                # 后台上传到 GitHub，不阻塞页面
+                                if GH_TOKEN and GH_DATA_REPO:
+                                    upload_mapping_to_github()
+
+                            st.success("归属关系已更新！")
+                            st.rerun()
                     else: 
                         st.error("请选择文件")
 
+            with tab3:
+                perf_log = load_perf_log()[::-1]
+                if not perf_log:
+                    st.info("暂无处理记录。数据重新处理后会在此显示各阶段耗时。")
+                else:
+                    status_icons = {"ok": "✅", "failed": "❌"}
+                    run_idx = st.selectbox(
+                        "处理记录", range(len(perf_log)), key="perf_run",
+                        format_func=lambda i: f"{status_icons.get(perf_log[i]['status'], '⏳')} {perf_log[i]['time']}"
+                                              f"  ({perf_log[i]['seconds']:.2f}s)",
+                    )
+                    run = perf_log[run_idx]
+                    p1, p2 = st.columns(2)
+                    p1.metric("总耗时", f"{run['seconds']:.2f}s")
+                    p2.metric("峰值内存", f"{run['peak_rss_mb']:.0f} MB" if run.get("peak_rss_mb") else "-",
+                              help="进程启动以来的最高常驻内存")
+
+                    stages_df = pd.DataFrame(run["stages"])
+                    if not stages_df.empty:
+                        stage_cols = {
+                            "stage": "阶段", "seconds": "耗时(s)", "rows": "行数", "mb": "内存(MB)", "rss_delta_mb": "内存变化(MB)"
+                        }
+                        stages_df = stages_df[[c for c in stage_cols if c in stages_df.columns]].rename(columns=stage_cols)
+                        st.dataframe(stages_df, hide_index=True, use_container_width=True)
+                    if run.get("cached"):
+                        st.caption("命中缓存: " + "、".join(run["cached"]))
+                    for w in run.get("warnings", []):
+                        st.warning(f"重复键: {w}")
+                    if run.get("error"):
+                        st.error("处理失败")
+                        st.code(run["error"], language=None)
+
 
 store_rank_path = get_store_rank_path()
 op_data_ready = os.path.exists(PATH_F) and os.path. exists(PATH_D) and os.path.exists(PATH_A) and (store_rank_path is not None)
 
 if op_data_ready:
-    df_advisors, df_stores = process_data(PATH_F, PATH_D, PATH_A, store_rank_path, PATH_M)
+    data_fingerprint = get_dataset_fingerprint([PATH_F, PATH_D, PATH_A, store_rank_path, PATH_M])
+    period = current_period_tag()
+    try:
+        df_advisors, df_stores, kpi_cube = process_data(PATH_F, PATH_D, PATH_A, store_rank_path, PATH_M, data_fingerprint, period)
+    except Exception as e:
+        st.error(f"处理出错:  {e}")
+        st.text(traceback.format_exc())
+        df_advisors, df_stores, kpi_cube = None, None, None
+    
+    # 上一考评周期，用于环比
+    prev_period = previous_period_tag(period)
+    prev_cube = load_history_cube(prev_period) if prev_period else None
 
     if df_advisors is not None: 
         col_header, col_update = st.columns([3, 1])
@@ -707,6 +2463,9 @@ if op_data_ready:
         with col_update: 
             upd = get_data_update_time(store_rank_path)
             upd_text = upd.strftime("%Y-%m-%d %H:%M") if upd else "暂无"
+            if prev_cube is not None:
+                prev_text = datetime.strptime(prev_period, "%Y%m%d-%H%M%S").strftime("%Y-%m-%d %H:%M")
+                upd_text += f"<br>📈 环比基准: {prev_text}"
             st.markdown(f"<div style='text-align: right;color:gray;font-size: 12px;padding-top:20px;'>🕒 数据更新: {upd_text}</div>", unsafe_allow_html=True)
 
         # =========================================================
@@ -716,41 +2475,24 @@ if op_data_ready:
         
         f_c1, f_c2, f_c3, f_c4 = st.columns(4)
         
-        if "区域经理" in df_stores.columns:
-            mgr_list = sorted(df_stores["区域经理"]. dropna().astype(str).unique().tolist())
-        else:
-            mgr_list = []
-        all_managers = ["全部"] + mgr_list
+        h_index = build_hierarchy_index(data_fingerprint, df_stores)
+        h_options = h_index["options"]
+        all_managers = ["全部"] + h_options[()]
 
         with f_c1:
             sel_mgr = st.selectbox("1️⃣ 区域经理", all_managers, key="filter_mgr")
         
-        df_l2 = df_stores if sel_mgr == "全部" else df_stores[df_stores["区域经理"] == sel_mgr]
-        if "省份" in df_l2.columns:
-            prov_list = sorted(df_l2["省份"].dropna().astype(str).unique().tolist())
-        else:
-            prov_list = []
-        all_provs = ["全部"] + prov_list
+        all_provs = ["全部"] + h_options.get((sel_mgr,), [])
         
         with f_c2:
             sel_prov = st.selectbox("2️⃣ 省份", all_provs, key="filter_prov")
         
-        df_l3 = df_l2 if sel_prov == "全部" else df_l2[df_l2["省份"] == sel_prov]
-        if "城市" in df_l3.columns:
-            city_list = sorted(df_l3["城市"].dropna().astype(str).unique().tolist())
-        else:
-            city_list = []
-        all_cities = ["全部"] + city_list
+        all_cities = ["全部"] + h_options.get((sel_mgr, sel_prov), [])
         
         with f_c3:
             sel_city = st. selectbox("3️⃣ 城市", all_cities, key="filter_city")
         
-        df_l4 = df_l3 if sel_city == "全部" else df_l3[df_l3["城市"] == sel_city]
-        if "门店名称" in df_l4.columns:
-            store_list = sorted(df_l4["门店名称"]. dropna().astype(str).unique().tolist())
-        else:
-            store_list = []
-        all_stores = ["全部"] + store_list
+        all_stores = ["全部"] + h_options.get((sel_mgr, sel_prov, sel_city), [])
 
         with f_c4:
             sel_store = st. selectbox("4️⃣ 门店", all_stores, key="filter_store")
@@ -759,32 +2501,45 @@ if op_data_ready:
         # 数据过滤逻辑
         # =========================================================
         
-        filtered_stores = df_l4.copy()
+        filtered_stores = df_stores.take(h_index["rows"].get((sel_mgr, sel_prov, sel_city), []))
         
         if sel_store == "全部": 
-            current_df = filtered_stores. copy()
+            current_df = filtered_stores
             
-            if sel_city != "全部":  rank_title = f"🏆 {sel_city} - 门店排名"
-            elif sel_prov != "全部": rank_title = f"🏆 {sel_prov} - 门店排名"
-            elif sel_mgr != "全部": rank_title = f"🏆 {sel_mgr}区域 - 门店排名"
-            else: rank_title = "🏆 全区门店排名"
+            # 名次在当前筛选组合（经理/省份/城市）内计算，与下方列表一致
+            scope_names = [name for sel, name in zip((sel_mgr, sel_prov, sel_city), (f"{sel_mgr}区域", sel_prov, sel_city))
+                           if sel != "全部"]
+            rank_title = f"🏆 {' / '.join(scope_names)} - 门店排名" if scope_names else "🏆 全区门店排名"
+            rank_col = store_rank_col(sel_mgr, sel_prov, sel_city)
             
-            kpi_leads = current_df["线索量"].sum()
-            kpi_visits = current_df["到店量"].sum()
-            kpi_rate = kpi_visits / kpi_leads if kpi_leads > 0 else 0
-            kpi_score = current_df["质检总分"].mean()
+            kpi_key = ("stores", sel_mgr, sel_prov, sel_city)
             
             current_df["名称"] = current_df["门店名称"]
+            # 层级索引里已按数据集排好序的门店名，不必每次重跑排序
+            locate_options = all_stores[1:]
             
         else:
             current_df = df_advisors[df_advisors["门店名称"] == sel_store]. copy()
             current_df["名称"] = current_df["邀约专员/管家"]
-            rank_title = f"👤 {sel_store} - DCC/管家排名"
+            rank_title, rank_col = f"👤 {sel_store} - DCC/管家排名", "排名_门店"
+            locate_options = sorted(current_df["名称"].dropna().astype(str).unique())
             
-            kpi_leads = current_df["线索量"].sum()
-            kpi_visits = current_df["到店量"].sum()
-            kpi_rate = kpi_visits / kpi_leads if kpi_leads > 0 else 0
-            kpi_score = current_df["质检总分"].mean()
+            kpi_key = ("store", sel_store, "", "")
+
+        kpi = kpi_lookup(kpi_cube, kpi_key)
+        prev_kpi = kpi_lookup(prev_cube, kpi_key) if prev_cube is not None else {}
+
+        kpi_leads = kpi.get("线索量", 0)
+        kpi_visits = kpi.get("到店量", 0)
+        kpi_rate = kpi_visits / kpi_leads if kpi_leads > 0 else 0
+        kpi_score = kpi["score_sum"] / kpi["score_cnt"] if kpi.get("score_cnt") else np.nan
+        
+        if prev_kpi:
+            prev_rate = kpi_ratio(prev_kpi, "到店量", "线索量")
+            prev_score = prev_kpi["score_sum"] / prev_kpi["score_cnt"] if prev_kpi.get("score_cnt") else np.nan
+            prev_conn = kpi_ratio(prev_kpi, "conn_num", "conn_denom")
+        else:
+            prev_rate = prev_score = prev_conn = None
 
         # =========================================================
         # 仪表盘展示
@@ -793,73 +2548,77 @@ if op_data_ready:
         k1, k2, k3, k4 = st.columns(4)
         k1.metric("总有效线索", f"{int(kpi_leads):,}")
         k2.metric("总实际到店", f"{int(kpi_visits):,}")
-        k3.metric("线索到店率", f"{kpi_rate:.1%}")
-        k4.metric("平均质检总分", f"{kpi_score:.1f}")
+        k3.metric("线索到店率", f"{kpi_rate:.1%}", delta=kpi_delta(kpi_rate, prev_rate, "+.1%"))
+        k4.metric("平均质检总分", f"{kpi_score:.1f}", delta=kpi_delta(kpi_score, prev_score, "+.1f"))
 
         st.markdown("---")
         st.subheader("2️⃣ DCC 外呼过程监控 (Process)")
 
-        def calc_kpi_rate(df, num, denom):
-            if num not in df.columns or denom not in df.columns: return 0
-            total_num = df[num].sum()
-            total_denom = df[denom]. sum()
-            return total_num / total_denom if total_denom > 0 else 0
-
         p1, p2, p3, p4 = st.columns(4)
-        avg_conn = calc_kpi_rate(current_df, "conn_num", "conn_denom")
-        avg_timely = calc_kpi_rate(current_df, "timely_num", "timely_denom")
-        avg_call2 = calc_kpi_rate(current_df, "call2_num", "call2_denom")
-        avg_call3 = calc_kpi_rate(current_df, "call3_num", "call3_denom")
+        avg_conn = kpi_ratio(kpi, "conn_num", "conn_denom")
+        avg_timely = kpi_ratio(kpi, "timely_num", "timely_denom")
+        avg_call2 = kpi_ratio(kpi, "call2_num", "call2_denom")
+        avg_call3 = kpi_ratio(kpi, "call3_num", "call3_denom")
 
-        p1.metric("📞 外呼接通率", f"{avg_conn:.1%}")
+        p1.metric("📞 外呼接通率", f"{avg_conn:.1%}", delta=kpi_delta(avg_conn, prev_conn, "+.1%"))
         p2.metric("⚡ DCC及时处理率", f"{avg_timely:.1%}")
         p3.metric("🔄 二次外呼率", f"{avg_call2:.1%}")
         p4.metric("🔁 三次外呼率", f"{avg_call3:.1%}")
         
-        plot_df_vis = current_df. copy()
+        # 图表只用到这些列，避免整表复制
+        plot_cols = ["名称", "线索量", "质检总分", "线索到店率_数值", "外呼接通率", "S_60s", "S_Time",
+                     "DCC及时处理率", "DCC二次外呼率", "DCC三次外呼率"]
+        plot_df_vis = current_df[[c for c in plot_cols if c in current_df.columns]].copy()
         plot_df_vis["质检总分_显示"] = plot_df_vis. get("质检总分", pd.Series([0]*len(plot_df_vis))).fillna(0)
 
+        # 图表缓存键：数据指纹 + 当前筛选
+        fig_key = (data_fingerprint, sel_mgr, sel_prov, sel_city, sel_store)
+
         c_proc_1, c_proc_2 = st.columns(2)
         with c_proc_1:
             st. markdown("#### 🕵️ 异常侦测：外呼接通率 vs 60秒通话占比")
             if "S_60s" in plot_df_vis.columns and "外呼接通率" in plot_df_vis.columns:
-                fig_p1 = px. scatter(
-                    plot_df_vis, x="外呼接通率", y="S_60s",
-                    size="线索量", color="质检总分_显示", hover_name="名称",
-                    color_continuous_scale="RdYlGn", height=350,
-                )
-                fig_p1.add_vline(x=avg_conn, line_dash="dash", line_color="gray")
-                fig_p1.update_layout(xaxis=dict(tickformat=".0%"))
+                def build_fig_p1():
+                    fig_p1 = scatter_chart(plot_df_vis, "外呼接通率", "S_60s", "RdYlGn", 350)
+                    fig_p1.add_vline(x=avg_conn, line_dash="dash", line_color="gray")
+                    fig_p1.update_layout(xaxis=dict(tickformat=".0%"))
+                    return fig_p1
+                fig_p1 = cached_figure(fig_key + ("conn_vs_60s", None), build_fig_p1)
                 st.plotly_chart(fig_p1, use_container_width=True)
             else:  st.warning("数据不足")
 
         with c_proc_2:
             st.markdown("#### 🔗 归因分析：过程指标 vs 线索首邀到店率")
-            x_axis_choice = st.radio("选择横轴指标：", ["DCC及时处理率", "DCC二次外呼率", "DCC三次外呼率"], horizontal=True)
-            
             plot_df_vis["线索到店率_显示"] = pd.to_numeric(plot_df_vis. get("线索到店率_数值", 0)).fillna(0).clip(0, 1)
-            
-            if x_axis_choice in plot_df_vis. columns:
-                fig_p2 = px.scatter(
-                    plot_df_vis, x=x_axis_choice, y="线索到店率_显示",
-                    size="线索量", color="质检总分_显示", hover_name="名称",
-                    color_continuous_scale="Blues", height=300
-                )
-                fig_p2.update_layout(xaxis=dict(tickformat=".0%"), yaxis=dict(tickformat=".1%"))
-                st.plotly_chart(fig_p2, use_container_width=True)
-            else: st. warning("数据不足")
+            attribution_chart(plot_df_vis, fig_key)
 
         st.markdown("---")
 
         c_left, c_right = st.columns([1,2])
         with c_left:
             st.markdown(f"### {rank_title}")
-            if "线索到店率_数值" in current_df.columns:
-                rank_df = current_df[["名称", "线索到店率", "线索到店率_数值", "质检总分"]].copy()
-                rank_df["Sort_Score"] = rank_df["线索到店率_数值"].fillna(-1)
-                rank_df = rank_df.sort_values("Sort_Score", ascending=False).head(15)
+            if rank_col in current_df.columns and not current_df.empty:
+                # 排名已在 process_data 中按各层级算好，这里只做部分选择
+                n_pages = -(-len(current_df) // RANK_PAGE_SIZE)
+                locate = st.selectbox("📍 查看排名：", ["—"] + locate_options)
+                if locate != "—":
+                    my_rank = int(current_df.loc[current_df["名称"].astype(str) == locate, rank_col].iloc[0])
+                    # 视图内排在其前面的行数决定所在页
+                    position = int((current_df[rank_col] < my_rank).sum()) + 1
+                    st.info(f"{locate}：第 {my_rank} 名")
+                    page = -(-position // RANK_PAGE_SIZE)
+                elif n_pages > 1:
+                    page = st.number_input(f"页码 (共 {n_pages} 页)", min_value=1, max_value=n_pages, value=1)
+                else:
+                    page = 1
+
+                show_cols, renames = ["名称", rank_col, "线索到店率", "质检总分"], {rank_col: "排名"}
+                if rank_col != "排名_全国":
+                    show_cols.append("排名_全国")
+                    renames["排名_全国"] = "全国排名"
+                rank_df = rank_page(current_df, rank_col, page)[show_cols]
                 st. dataframe(
-                    rank_df[["名称", "线索到店率", "质检总分"]],
+                    rank_df.rename(columns=renames),
                     hide_index=True, use_container_width=True, height=400,
                     column_config={"质检总分": st.column_config. NumberColumn(format="%.1f")}
                 )
@@ -868,13 +2627,14 @@ if op_data_ready:
         with c_right:
             st. markdown("### 💡 话术质量 vs 转化结果")
             if "S_Time" in plot_df_vis. columns:
-                fig = px.scatter(
-                    plot_df_vis, x="S_Time", y="线索到店率_显示",
-                    size="线索量", color="质检总分_显示", hover_name="名称",
-                    color_continuous_scale="Reds", height=400,
-                    labels={"S_Time": "明确到店时间得分", "线索到店率_显示":  "线索到店率"}
-                )
-                fig.update_layout(yaxis=dict(tickformat=".1%"))
+                def build_fig():
+                    fig = scatter_chart(
+                        plot_df_vis, "S_Time", "线索到店率_显示", "Reds", 400,
+                        labels={"S_Time": "明确到店时间得分", "线索到店率_显示":  "线索到店率"}
+                    )
+                    fig.update_layout(yaxis=dict(tickformat=".1%"))
+                    return fig
+                fig = cached_figure(fig_key + ("time_vs_rate", None), build_fig)
                 st. plotly_chart(fig, use_container_width=True)
             else: st.warning("数据不足")
 
@@ -885,108 +2645,27 @@ if op_data_ready:
             if "线索量" in diag_df.columns:
                  diag_df["线索量"] = pd.to_numeric(diag_df["线索量"], errors="coerce").fillna(0)
 
-            diag_list = sorted(diag_df["邀约专员/管家"].dropna().astype(str).unique())
-            
-            if diag_list: 
-                sel_p = st.selectbox("🔍 选择该店邀约专员/管家：", diag_list)
-                p_row = diag_df[diag_df["邀约专员/管家"] == sel_p]
-                
-                if not p_row. empty:
-                    p = p_row.iloc[0]
-
-                    d1, d2, d3 = st.columns([1,1,1.2])
-                    
-                    with d1:
-                        st.caption("转化漏斗 (RESULT)")
-                        leads = float(pd.to_numeric(p. get("线索量", 0), errors="coerce") or 0)
-                        visits = float(pd. to_numeric(p.get("到店量", 0), errors="coerce") or 0)
-                        
-                        fig_f = go.Figure(
-                            go.Funnel(
-                                y=["线索量", "到店量"],
-                                x=[leads, visits],
-                                textinfo="value+percent initial",
-                                marker={"color": ["#d9d9d9", "#bb0a30"]},
-                            )
-                        )
-                        fig_f.update_layout(showlegend=False, height=180, margin=dict(t=0, b=0, l=0, r=0))
-                        st.plotly_chart(fig_f, use_container_width=True)
-
-                        st.metric("线索到店率", p.get("线索到店率", "0.0%"))
-                        
-                        avg_call_dur = float(pd.to_numeric(p.get("通话时长", 0), errors="coerce") or 0)
-                        st.caption(f"平均通话时长: {avg_call_dur:.1f} 秒")
-
-                    has_score = ("质检总分" in p.index) and (not pd.isna(p.get("质检总分"))) and (p.get("质检总分") != 0)
-                    
-                    with d2:
-                        st.caption("质检得分详情 (QUALITY)")
-                        if has_score: 
-                            metrics = {
-                                "明确到店时间": p.get("S_Time", np.nan),
-                                "60秒通话占比": p.get("S_60s", np.nan),
-                                "用车需求": p.get("S_Needs", np.nan),
-                                "车型信息介绍": p. get("S_Car", np.nan),
-                                "政策相关话术": p.get("S_Policy", np.nan),
-                                "添加微信": p.get("S_Wechat", np. nan),
-                            }
-                            
-                            for k, v in metrics.items():
-                                val = 0 if pd. isna(v) else float(v)
-                                c_a, c_b = st.columns([3,1])
-                                c_a.progress(min(val / 100,1.0))
-                                c_b.write(f"{val:.0f}")
-                                st.caption(k)
-                        else: 
-                            st. warning("暂无质检数据")
-
-                    with d3:
-                        if has_score: 
-                            st.error("🤖 诊断建议")
-                            
-                            val_60s = 0 if pd. isna(p. get("S_60s", np.nan)) else float(p.get("S_60s"))
-                            
-                            other_kpis = {
-                                "明确到店":  (p.get("S_Time", np.nan), "建议使用二选一法锁定时间。"),
-                                "添加微信": (p.get("S_Wechat", np.nan), "建议以发定位/资料为由加微。"),
-                                "用车需求": (p.get("S_Needs", np.nan), "需加强需求挖掘，至少问清场景/预算/家庭结构。"),
-                                "车型信息": (p. get("S_Car", np.nan), "需提升产品讲解链路，先讲1-2个强卖点。"),
-                                "政策相关": (p.get("S_Policy", np.nan), "需准确传达政策，并用截止时间推动决策。"),
-                            }
-
-                            issues_list = []
-                            is_failing = False
-
-                            if val_60s < 60:
-                                msg = "开场先抛利益点 + 明确下一步动作。"
-                                issues_list.append(f"🟠 **60秒占比 (得分{val_60s:.1f})** {msg}")
-                                is_failing = True
-
-                            cleaned_others = {}
-                            for k, (v, advice) in other_kpis.items():
-                                score = 0 if pd.isna(v) else float(v)
-                                cleaned_others[k] = (score, advice)
-                                if score < 80:
-                                    issues_list.append(f"🔴 **{k} (得分{score:.1f})** {advice}")
-                                    is_failing = True
-
-                            if is_failing:
-                                for item in issues_list: 
-                                    st.markdown(item)
-                                st.warning("⚠️ 存在明显短板，请重点辅导。")
-                            else:
-                                all_above_85 = all(score >= 85 for score, _ in cleaned_others.values())
-                                if all_above_85:
-                                    st.success("🌟 各项指标表现优秀！")
-                                else: 
-                                    st. info("✅ 各项指标合格，但仍有提升空间。")
-                        else: 
-                            st.info("暂无数据，无法生成诊断建议。")
-            else: 
-                st.warning("该门店下暂无数据。")
+            advisor_diagnosis_panel(diag_df)
         else:
              st.info("💡 选择具体【门店】后，可查看该店顾问的详细诊断报告。")
 
+             st.markdown("### 🚨 需重点辅导名单")
+             region_advisors = df_advisors[df_advisors["门店名称"].isin(filtered_stores["门店名称"])]
+             focus_df = region_advisors[region_advisors["诊断等级"] == "重点辅导"]
+             if focus_df.empty:
+                 st.success("当前范围内暂无需重点辅导的邀约专员/管家。")
+             else:
+                 focus_df = focus_df.sort_values(["短板数", "质检总分"], ascending=[False, True])
+                 # 建议码组合很少，按去重后的取值翻译成短板名称
+                 code_labels = {codes: "、".join(DIAG_LABELS[c] for c in codes.split(",")) for codes in focus_df["建议码"].unique()}
+                 st.dataframe(
+                     focus_df[["门店名称", "邀约专员/管家", "质检总分", "短板数"]].assign(短板项=focus_df["建议码"].map(code_labels)),
+                     hide_index=True, use_container_width=True, height=400,
+                     column_config={"质检总分": st.column_config. NumberColumn(format="%.1f")}
+                 )
+
+elif not startup_sync["done"].is_set():
+    st.info("⏳ 正在从云端加载数据，完成后页面会自动刷新...")
 else:
     st. info("👋 欢迎使用 Audi 效能看板！")
     st.warning("👉 请在左侧侧边栏上传数据。")
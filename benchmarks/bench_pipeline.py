@@ -0,0 +1,198 @@
+"""DCC 看板数据管线基准测试
+
+对不同规模的合成数据逐阶段计时，并用 tracemalloc 记录各阶段的峰值内存：
+    header     预读前几行并定位表头
+    read       解析原始报表（_parse_report）
+    ingest     读取上传时生成的规范化副本（smart_read 命中副本）
+    clean      第 0-4 步各表清洗
+    merge      第 5 步清洗与合并
+    mapping    第 6 步注入归属信息
+    diagnose / rank / compact / kpi_cube
+    build_frames  冷启动端到端（清空阶段缓存），分别在无副本 (raw) 与有副本 (ingest) 时计时
+
+用法:
+    python benchmarks/bench_pipeline.py [--sizes 100 1000 10000 50000] [--repeat 3]
+
+合成数据缓存在 --data-dir，同一规模与种子只生成一次；结果打印为表格并写入 --output。
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synth_data  # noqa: E402
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+# (阶段名, 文件键, 是否门店排名表)
+READ_SPECS = [
+    ("funnel", "funnel", False),
+    ("dcc", "dcc", False),
+    ("ams", "ams", False),
+    ("store_rank", "store_rank", True),
+    ("mapping", "mapping", False),
+]
+
+
+def import_app(workdir: str):
+    """在临时目录中导入 app.py：导入时会读取 st.secrets 并在当前目录创建 data_store"""
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write('GH_TOKEN = ""\nGH_DATA_REPO = ""\n')
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    # 脱离 streamlit run 导入会刷大量 bare mode 警告
+    logging.disable(logging.WARNING)
+    import app
+    return app
+
+
+def measure(fn, repeat: int, prepare=None):
+    """返回 (最短耗时秒, 峰值内存字节, 最后一次结果)
+
+    prepare 在计时之外生成本次调用的参数（如复制会被原地修改的输入）。
+    先计时 repeat 次，再单独跑一次 tracemalloc，避免追踪开销计入耗时。
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        args = prepare() if prepare else ()
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+
+    args = prepare() if prepare else ()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def _rows(obj) -> int:
+    if not hasattr(obj, "__len__"):
+        return 0
+    if isinstance(obj, tuple):
+        return sum(_rows(o) for o in obj)
+    return len(obj)
+
+
+def bench_size(app, paths: dict, repeat: int):
+    """跑一个规模的全部阶段，返回 [(阶段, 秒, 峰值字节, 行数)]"""
+    results = []
+
+    def record(stage, fn, prepare=None):
+        seconds, peak, out = measure(fn, repeat, prepare)
+        results.append((stage, seconds, peak, _rows(out)))
+        return out
+
+    for name, key, is_rank in READ_SPECS:
+        path = paths[key]
+        search_rows = 20 if is_rank else 15
+        if path.endswith(".csv"):
+            def peek(path=path, search_rows=search_rows):
+                rows = app._peek_csv_rows(path, app.sniff_encoding(path), search_rows)
+                return app._find_header_row(rows, search_rows)
+        else:
+            def peek(path=path, search_rows=search_rows):
+                return app._find_header_row(app._peek_excel_rows(path, search_rows), search_rows)
+        record(f"header:{name}", peek)
+
+    raws = {}
+    for name, key, is_rank in READ_SPECS:
+        raws[name] = record(f"read:{name}", lambda path=paths[key], is_rank=is_rank: app._parse_report(path, is_rank))
+    for name, key, is_rank in READ_SPECS:
+        app.smart_read(paths[key], is_rank)  # 生成副本
+        record(f"ingest:{name}", lambda path=paths[key], is_rank=is_rank: app.smart_read(path, is_rank))
+
+    mapping = record("clean:mapping", app.build_mapping, lambda: (raws["mapping"],))
+    funnel = record("clean:funnel", app.clean_funnel, lambda: (raws["funnel"],))
+    dcc = record("clean:dcc", app.clean_dcc, lambda: (raws["dcc"],))
+    store_rank = record("clean:store_rank", app.clean_store_rank, lambda: (raws["store_rank"],))
+    ams = record("clean:ams", app.clean_ams, lambda: (raws["ams"],))
+
+    merged = record("merge", app.merge_frames, lambda: (*funnel, dcc, ams, store_rank))
+    full_advisors, full_stores = record("mapping", app.inject_mapping, lambda: (*merged, mapping))
+
+    record("diagnose", app.diagnose_advisors, lambda: (full_advisors.copy(),))
+    full_advisors = app.rank_frame(app.diagnose_advisors(full_advisors.copy()), app.ADVISOR_RANK_SCOPES)
+    record("rank", app.rank_frame, lambda: (full_stores.copy(), app.STORE_RANK_SCOPES))
+    full_stores = app.rank_frame(full_stores.copy(), app.STORE_RANK_SCOPES)
+    record("compact", lambda a, s: (app.compact_frame(a), app.compact_frame(s)),
+           lambda: (full_advisors.copy(), full_stores.copy()))
+    full_advisors, full_stores = app.compact_frame(full_advisors), app.compact_frame(full_stores)
+    record("kpi_cube", app.build_kpi_cube, lambda: (full_advisors, full_stores))
+
+    def cold_build():
+        app._stage_cache.clear()
+        return app.build_frames(paths["funnel"], paths["dcc"], paths["ams"], paths["store_rank"], paths["mapping"])
+
+    def drop_copies():
+        for path in paths.values():
+            if os.path.exists(app.ingest_path(path)):
+                os.remove(app.ingest_path(path))
+        return ()
+    record("build_frames:raw", cold_build, drop_copies)
+    record("build_frames:ingest", cold_build)
+
+    return results
+
+
+def format_table(n_advisors: int, results) -> str:
+    lines = [
+        f"== {n_advisors} advisors ==",
+        f"{'stage':<20}{'time (ms)':>12}{'peak (MB)':>12}{'rows':>10}",
+    ]
+    for stage, seconds, peak, rows in results:
+        lines.append(f"{stage:<20}{seconds * 1000:>12.1f}{peak / 2**20:>12.1f}{rows:>10}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="顾问人数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段计时次数，取最短")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "dcc_bench_data"))
+    parser.add_argument("--output", default=os.path.join(REPO_ROOT, "bench_output.txt"))
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir)
+    output = os.path.abspath(args.output)
+    datasets = {}
+    for n in args.sizes:
+        out_dir = os.path.join(data_dir, f"{n}_seed{args.seed}")
+        if not os.path.exists(os.path.join(out_dir, "store_mapping.xlsx")):
+            print(f"generating {n} advisors -> {out_dir}", flush=True)
+        datasets[n] = {
+            key: os.path.join(out_dir, name)
+            for key, name in [("funnel", "funnel.xlsx"), ("dcc", "dcc.xlsx"), ("ams", "ams.xlsx"),
+                              ("store_rank", "store_rank.csv"), ("mapping", "store_mapping.xlsx")]
+        }
+        if not os.path.exists(datasets[n]["mapping"]):
+            synth_data.generate(out_dir, n, args.seed)
+
+    app = import_app(tempfile.mkdtemp(prefix="dcc_bench_"))
+
+    tables = []
+    for n, paths in datasets.items():
+        table = format_table(n, bench_size(app, paths, args.repeat))
+        print(table + "\n", flush=True)
+        tables.append(table)
+
+    with open(output, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(tables) + "\n")
+    print(f"written to {output}")
+
+
+if __name__ == "__main__":
+    main()
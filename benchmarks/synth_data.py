@@ -0,0 +1,179 @@
+"""合成全国规模的业务报表，供基准测试使用
+
+生成与线上报表列名一致的五个文件：
+    funnel.xlsx         漏斗指标表：标题行 + 分组表头 + 表头，代理商只写在每店首行，
+                        每店一行「小计」，末尾一行「合计」
+    dcc.xlsx            顾问质检表
+    ams.xlsx            AMS 跟进表
+    store_rank.csv      门店排名表：GBK 编码，带标题行
+    store_mapping.xlsx  代理商归属表
+
+用法:
+    python benchmarks/synth_data.py OUT_DIR --advisors 10000 [--seed 0]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+MANAGERS = ["张伟", "王芳", "李娜", "刘洋", "陈静", "杨磊", "赵敏", "黄强"]
+PROVINCES = {
+    "北京": ["北京市"],
+    "上海": ["上海市"],
+    "广东": ["广州市", "深圳市", "佛山市", "东莞市"],
+    "浙江": ["杭州市", "宁波市", "温州市"],
+    "江苏": ["南京市", "苏州市", "无锡市"],
+    "四川": ["成都市", "绵阳市"],
+    "山东": ["济南市", "青岛市", "烟台市"],
+    "湖北": ["武汉市", "宜昌市"],
+}
+ADVISORS_PER_STORE = 8
+
+FUNNEL_COLS = ["代理商", "邀约专员/管家", "线上_有效线索数", "线上_到店数", "线索到店率", "试驾率"]
+DCC_COLS = ["顾问名称", "门店名称", "质检总分", "60秒通话", "用车需求", "车型信息", "政策相关", "明确到店时间", "添加微信"]
+AMS_COLS = [
+    "代理商", "管家姓名", "DCC平均通话时长", "DCC接通线索数", "DCC外呼线索数", "DCC及时处理线索", "需外呼线索数",
+    "二次外呼线索数", "需再呼线索数", "DCC三次外呼的线索数", "DCC二呼状态为需再呼的线索数",
+]
+RANK_COLS = ["排名", "门店ID", "门店名称", "质检总分", "60秒通话占比", "用车需求", "车型信息", "政策相关", "明确到店时间", "添加微信"]
+
+
+def _stores(n_stores: int, rng: np.random.Generator) -> pd.DataFrame:
+    """门店及其归属；部分门店名带括号后缀或多余空格，检验名称清洗"""
+    provs = list(PROVINCES)
+    rows = []
+    for i in range(n_stores):
+        prov = provs[i % len(provs)]
+        city = PROVINCES[prov][rng.integers(len(PROVINCES[prov]))]
+        name = f"{city[:-1]}奥迪{i}店"
+        raw = name
+        if i % 5 == 0:
+            raw = f"{name}（{city[:-1]}）"
+        elif i % 7 == 0:
+            raw = f" {name} "
+        rows.append((name, raw, MANAGERS[i % len(MANAGERS)], prov, city))
+    return pd.DataFrame(rows, columns=["name", "raw", "mgr", "prov", "city"])
+
+
+def _scores(n: int, rng: np.random.Generator, low: float = 40, high: float = 100) -> np.ndarray:
+    return np.round(rng.uniform(low, high, n), 1)
+
+
+def generate(out_dir: str, n_advisors: int, seed: int = 0) -> dict:
+    """写出五个报表文件，返回 {名称: 路径}"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    n_stores = max(1, n_advisors // ADVISORS_PER_STORE)
+    stores = _stores(n_stores, rng)
+
+    # 顾问分配到门店：每店至少一人
+    store_idx = np.sort(np.concatenate([np.arange(n_stores), rng.integers(0, n_stores, n_advisors - n_stores)]))
+    advisors = pd.DataFrame({
+        "store": store_idx,
+        "name": [f"顾问{i:05d}" for i in range(n_advisors)],
+        "leads": rng.integers(0, 300, n_advisors),
+    })
+    advisors["visits"] = (advisors["leads"] * rng.uniform(0, 0.8, n_advisors)).astype(int)
+
+    # --- 漏斗：每店首行写代理商，其余留空；店尾追加小计行 ---
+    funnel_rows = []
+    for s, grp in advisors.groupby("store", sort=True):
+        raw = stores.at[s, "raw"]
+        for j, (name, leads, visits) in enumerate(zip(grp["name"], grp["leads"], grp["visits"])):
+            rate = f"{visits / leads * 100:.1f}%" if leads else "0.0%"
+            funnel_rows.append([raw if j == 0 else None, name, leads, visits, rate, f"{rng.uniform(0, 30):.1f}%"])
+        tl, tv = int(grp["leads"].sum()), int(grp["visits"].sum())
+        funnel_rows.append([None, "小计", tl, tv, f"{tv / tl * 100:.1f}%" if tl else "0.0%", "-"])
+    tl, tv = int(advisors["leads"].sum()), int(advisors["visits"].sum())
+    funnel_rows.append(["合计", "合计", tl, tv, f"{tv / tl * 100:.1f}%" if tl else "0.0%", "-"])
+    header_block = [
+        ["DCC 漏斗指标周报"] + [None] * 5,
+        [None] * 6,
+        ["基础信息", None, "线上指标", None, "转化", None],
+        FUNNEL_COLS,
+    ]
+    paths = {"funnel": os.path.join(out_dir, "funnel.xlsx")}
+    pd.DataFrame(header_block + funnel_rows).to_excel(paths["funnel"], header=False, index=False)
+
+    # --- 质检：约 90% 的顾问有质检记录 ---
+    qc = advisors[rng.random(n_advisors) < 0.9]
+    n_qc = len(qc)
+    dcc = pd.DataFrame({
+        "顾问名称": qc["name"].to_numpy(),
+        "门店名称": stores["raw"].to_numpy()[qc["store"].to_numpy()],
+        "质检总分": _scores(n_qc, rng, 50),
+        "60秒通话": _scores(n_qc, rng, 20),
+        "用车需求": _scores(n_qc, rng),
+        "车型信息": _scores(n_qc, rng),
+        "政策相关": _scores(n_qc, rng),
+        "明确到店时间": _scores(n_qc, rng),
+        "添加微信": _scores(n_qc, rng),
+    }, columns=DCC_COLS)
+    paths["dcc"] = os.path.join(out_dir, "dcc.xlsx")
+    dcc.to_excel(paths["dcc"], index=False)
+
+    # --- AMS ---
+    need = rng.integers(0, 200, n_advisors)
+    recall = rng.integers(0, 40, n_advisors)
+    recall2 = rng.integers(0, 20, n_advisors)
+    ams = pd.DataFrame({
+        "代理商": stores["raw"].to_numpy()[advisors["store"].to_numpy()],
+        "管家姓名": advisors["name"].to_numpy(),
+        "DCC平均通话时长": np.round(rng.uniform(10, 180, n_advisors), 1),
+        "DCC接通线索数": (need * rng.uniform(0, 1, n_advisors)).astype(int),
+        "DCC外呼线索数": need,
+        "DCC及时处理线索": (need * rng.uniform(0, 1, n_advisors)).astype(int),
+        "需外呼线索数": need,
+        "二次外呼线索数": (recall * rng.uniform(0, 1, n_advisors)).astype(int),
+        "需再呼线索数": recall,
+        "DCC三次外呼的线索数": (recall2 * rng.uniform(0, 1, n_advisors)).astype(int),
+        "DCC二呼状态为需再呼的线索数": recall2,
+    }, columns=AMS_COLS)
+    paths["ams"] = os.path.join(out_dir, "ams.xlsx")
+    ams.to_excel(paths["ams"], index=False)
+
+    # --- 门店排名：GBK 编码 CSV，首行为标题 ---
+    rank = pd.DataFrame({
+        "排名": np.arange(1, n_stores + 1),
+        "门店ID": [f"SR{i:05d}" for i in range(n_stores)],
+        "门店名称": stores["raw"],
+        "质检总分": _scores(n_stores, rng, 60),
+        "60秒通话占比": _scores(n_stores, rng, 20),
+        "用车需求": _scores(n_stores, rng),
+        "车型信息": _scores(n_stores, rng),
+        "政策相关": _scores(n_stores, rng),
+        "明确到店时间": _scores(n_stores, rng),
+        "添加微信": _scores(n_stores, rng),
+    }, columns=RANK_COLS)
+    paths["store_rank"] = os.path.join(out_dir, "store_rank.csv")
+    with open(paths["store_rank"], "w", encoding="gbk", newline="") as f:
+        f.write("DCC 质控周报\n")
+        rank.to_csv(f, index=False)
+
+    # --- 归属表 ---
+    mapping = pd.DataFrame({
+        "门店名称": stores["name"],
+        "区域经理": stores["mgr"],
+        "省份": stores["prov"],
+        "城市": stores["city"],
+    })
+    paths["mapping"] = os.path.join(out_dir, "store_mapping.xlsx")
+    mapping.to_excel(paths["mapping"], index=False)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--advisors", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for name, path in generate(args.out_dir, args.advisors, args.seed).items():
+        print(f"{name:<12} {path}")
+
+
+if __name__ == "__main__":
+    main()